@@ -0,0 +1,130 @@
+# File: benchmark.py
+
+import copy
+import time
+import argparse
+
+import torch
+from torch._dynamo.utils import counters
+
+from config.config import parse_args
+from methods.model_selection import get_model, compile_model, enable_activation_checkpointing
+from losses.loss_selection import get_loss_function
+from frontends.frontend_selection import process_outputs, get_autocast, get_grad_scaler, \
+    get_micro_batch_size, split_batch, configure_batchnorm, freeze_batchnorm
+from loggers.metrics_logging import peak_memory_mib
+
+
+def benchmark_training(model, args, device, steps, warmup):
+    """
+    Seconds per training step and peak memory on a synthetic batch, with
+    args.precision and the micro-batching of train.py (--accum_steps,
+    --micro_batch_size, --bn_mode).
+
+    Returns:
+        (seconds per step, peak memory in MiB, graphs compiled during the
+        timed steps, i.e. recompiles after warmup)
+    """
+    criterion = get_loss_function(args)
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.learning_rate)
+    autocast = get_autocast(args, device)
+    scaler = get_grad_scaler(args, device)
+
+    inputs = torch.randn(args.batch_size, args.sample_rate * 2, device=device)
+    targets = torch.randint(args.num_classes, (args.batch_size,), device=device)
+
+    micro_batch_size = get_micro_batch_size(args)
+
+    def step():
+        optimizer.zero_grad()
+        for micro_inputs, micro_targets in split_batch(micro_batch_size, inputs, targets):
+            with autocast():
+                loss, outputs = process_outputs(model, args, micro_inputs, micro_targets, criterion)
+            scaler.scale(loss * (outputs.size(0) / inputs.size(0))).backward()
+        scaler.step(optimizer)
+        scaler.update()
+
+    model.train()
+    if args.bn_mode == 'frozen':
+        freeze_batchnorm(model)
+    for _ in range(max(warmup, 2)):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats(device)
+    graphs = counters['stats']['unique_graphs']
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    seconds = (time.perf_counter() - start) / steps
+    recompiles = counters['stats']['unique_graphs'] - graphs
+    return seconds, peak_memory_mib(device), recompiles
+
+
+def build_model(args):
+    torch.manual_seed(args.seed)
+    model = get_model(args, pretrained=False)
+    if hasattr(model, 'base') and hasattr(model, 'spectrogram_extractor'):
+        # The templates swap in their extractors when loading the pretrained weights
+        model.base.spectrogram_extractor = model.spectrogram_extractor
+        model.base.logmel_extractor = model.logmel_extractor
+    configure_batchnorm(model, args)
+    enable_activation_checkpointing(model, args.activation_checkpointing)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Training throughput and peak memory per precision and frontend; with --compile, '
+                    'also the speedup over eager and the recompile counts. Other arguments go to config.parse_args')
+    parser.add_argument('--precisions', nargs='+', default=None, choices=['fp32', 'fp16', 'bf16'],
+                        help='Default: fp32 and bf16, plus fp16 on CUDA (CPU float16 kernels are very slow)')
+    parser.add_argument('--frontends', nargs='+', default=None, help='Default: --frontend')
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=2,
+                        help='Untimed steps before timing; at least 2, so compiled runs finish compiling forward and backward')
+    bench_args, rest = parser.parse_known_args()
+    args = parse_args(['--model_name', 'panns_cnn6', '--batch_size', '8'] + rest)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    precisions = bench_args.precisions
+    if precisions is None:
+        precisions = ['fp32', 'bf16', 'fp16'] if device.type == 'cuda' else ['fp32', 'bf16']
+    frontends = bench_args.frontends or [args.frontend]
+    print(f"{args.model_name}, batch {args.batch_size} in micro-batches of {get_micro_batch_size(args)}, "
+          f"{args.sample_rate * 2} samples, {device}, compile {args.compile}, "
+          f"activation checkpointing {args.activation_checkpointing}")
+    if device.type == 'cpu':
+        print("Peak memory on CPU is the process' peak RSS, so it only grows across runs")
+
+    for frontend in frontends:
+        args.frontend = frontend
+        print(f"frontend {frontend}")
+        for precision in precisions:
+            args.precision = precision
+            model = build_model(args).to(device)
+            compiled = compile_model(copy.deepcopy(model), args.compile, args.compile_cache_dir)
+            seconds, memory, _ = benchmark_training(model, args, device, bench_args.steps, bench_args.warmup)
+            print(f"  {precision}: {args.batch_size / seconds:8.1f} samples/s, "
+                  f"{seconds * 1000:8.1f} ms/step, peak memory {memory:8.0f} MiB")
+            if args.compile == 'none':
+                continue
+
+            torch._dynamo.reset()
+            counters.clear()
+            start = time.perf_counter()
+            compiled_seconds, memory, recompiles = benchmark_training(
+                compiled, args, device, bench_args.steps, bench_args.warmup)
+            total = time.perf_counter() - start - compiled_seconds * bench_args.steps
+            graph_breaks = sum(counters['graph_break'].values())
+            print(f"  {precision}, compiled: {args.batch_size / compiled_seconds:8.1f} samples/s, "
+                  f"{compiled_seconds * 1000:8.1f} ms/step ({seconds / compiled_seconds:.2f}x), "
+                  f"peak memory {memory:8.0f} MiB, warmup incl. compilation {total:6.1f} s, "
+                  f"{counters['stats']['unique_graphs']} graphs, {graph_breaks} graph breaks, "
+                  f"{recompiles} recompiles after warmup")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,28 +2,37 @@
 
 import argparse
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Train Audio Model with Learning Rate Scheduler')
 
     # General Parameters
     general = parser.add_argument_group('General Parameters')
     general.add_argument('--seed', type=int, default=20, help='Random seed')
     general.add_argument('--data_path', type=str, default='/scratch/project_465001389/chandler_scratch/Projects/UWAC/datasets/affia3k/', help='Path to the dataset')
+    general.add_argument('--manifest', type=str, default=None, help='Path of the persisted dataset manifest (built on first use, refreshed incrementally)')
     general.add_argument('--dataset', type=str, default='affia3k', help='Dataset to use for training and validation')
     general.add_argument('--num_classes', type=int, default=4, help='Number of classes')
 
     # Training Parameters
     training = parser.add_argument_group('Training Parameters')
     training.add_argument('--batch_size', type=int, default=200, help='Batch size for training')
+    training.add_argument('--fast_collate', action='store_true', help='Collate into preallocated (pinned) batch buffers with integer labels')
     training.add_argument('--max_epoch', type=int, default=500, help='Maximum number of epochs')
     training.add_argument('--learning_rate', type=float, default=1e-3, help='Initial learning rate')
     training.add_argument('--loss', type=str, default='ce', help='Loss function to use (ce, focal, softboot, hardboot)')
     training.add_argument('--label_smoothing', type=float, default=0.0, help='Label smoothing factor')
+    training.add_argument('--accum_steps', type=int, default=1, help='Split every batch into this many micro-batches and accumulate their gradients (one optimizer step per batch)')
+    training.add_argument('--micro_batch_size', type=int, default=None, help='Examples per forward/backward pass; overrides --accum_steps (default: batch_size / accum_steps)')
+    training.add_argument('--bn_mode', type=str, default='accum', choices=['accum', 'micro', 'frozen'], help='BatchNorm under micro-batching: accum rescales the running-stat momentum to one update per batch, micro keeps it per micro-batch, frozen uses the running stats (eval mode) throughout training')
+    training.add_argument('--activation_checkpointing', type=int, default=0, help='Recompute the activations of every N-th PANNs conv block / AST transformer block in backward instead of storing them (0: off, 1: all blocks)')
+    training.add_argument('--compile', type=str, default='none', choices=['none', 'frontend', 'model'], help='torch.compile only the frontend modules or the whole model; batch_size must be a multiple of the micro-batch size, short validation batches are padded to full size')
+    training.add_argument('--compile_cache_dir', type=str, default=None, help='Persistent Inductor cache directory shared across runs')
+    training.add_argument('--precision', type=str, default='fp32', choices=['fp32', 'fp16', 'bf16'], help='Autocast precision of the forward pass (fp16 adds loss scaling); frontend spectra, logs, PCEN and cumsums stay in fp32')
 
     # Model Parameters
     model = parser.add_argument_group('Model Parameters')
     model.add_argument('--model_name', type=str, default='cnn10', help='Name of the model to use')
-    model.add_argument('--frontend', type=str, default='logmel', help='Frontend type (logmel, mixup, diffres)')
+    model.add_argument('--frontend', type=str, default='logmel', help='Frontend type (logmel, mixup, diffres, chroma, ...)')
 
     # Data Processing Parameters
     data_processing = parser.add_argument_group('Data Processing Parameters')
@@ -33,6 +42,11 @@ def parse_args():
     data_processing.add_argument('--mel_bins', type=int, default=64, help='Number of mel bins for audio feature extraction')
     data_processing.add_argument('--fmin', type=int, default=50, help='Minimum frequency for mel bins')
     data_processing.add_argument('--fmax', type=int, default=None, help='Maximum frequency for mel bins')
+    data_processing.add_argument('--stft_engine', type=str, default='fft', choices=['conv', 'fft'], help='Spectrogram/log-mel extractors of the templates: torchlibrosa conv DFT or FFT with a banded mel matrix')
+    data_processing.add_argument('--resampler', type=str, default='fft', help='Resampling engine for loading audio (fft, poly, torch)')
+    data_processing.add_argument('--waveform_store', type=str, default=None, help='Root of the pre-decoded, memory-mapped waveform store (built on first use)')
+    data_processing.add_argument('--feature_cache', type=str, default='none', choices=['none', 'ram', 'disk'], help='Cache deterministic log-mel features of the logmel frontend')
+    data_processing.add_argument('--feature_cache_dir', type=str, default=None, help='Directory of the on-disk log-mel feature cache')
     data_processing.add_argument('--freq_band', type=str, default='none', help='Frequency band for filtering (low, mid, high, none)')
 
     # Scheduler Parameters
@@ -45,11 +59,12 @@ def parse_args():
     # Augmentation Parameters
     augmentation = parser.add_argument_group('Augmentation Parameters')
     augmentation.add_argument('--audiomentations', action='store_true', help='Apply audiomentations')
-    augmentation.add_argument('--filter_chance', type=float, default=0.13, help='Chance of applying filter')
+    augmentation.add_argument('--batch_augment', action='store_true', help='Apply the audiomentations filters batched on the training device instead of per sample in the DataLoader workers')
+    augmentation.add_argument('--filter_chance', type=float, default=0.10, help='Per-example chance of applying the --freq_band filter (per-sample and --batch_augment paths)')
 
     # Logging Parameters
     logging_group = parser.add_argument_group('Logging Parameters')
     logging_group.add_argument('--wandb_mode', type=str, default='offline', help='WandB mode (online/offline)')
     logging_group.add_argument('--wandb_project', type=str, default='affia3k', help='WandB project name')
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
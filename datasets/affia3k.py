@@ -7,34 +7,58 @@ from torch.utils.data import Dataset, DataLoader
 import os
 import numpy as np
 import torch
-from scipy.signal import resample
 from itertools import chain
 import torchaudio
 
+from datasets.resampling import get_resampler
+from datasets.collate import BatchCollator
+from datasets.manifest import DatasetManifest
+from datasets.waveform_store import open_waveform_store
 
-def load_audio(path, sr=None):
-    y, _ = librosa.load(path, sr=None)
+
+def load_audio(path, sr=None, resampler='fft'):
+    y, native_sr = librosa.load(path, sr=None)
     # y = y / np.max(np.abs(y))
-    y = resample(y, num=sr*2)
+    y = get_resampler(resampler)(y, native_sr, sr, sr*2)
     return y
 
-def get_wav_name(split='strong', data_path='./'):
+CLASS_NAMES = ['strong', 'middle', 'weak', 'none']
+
+
+def get_wav_dirs(split='strong', data_path='./', listdir=os.listdir):
     """
-    params: str
-        middle, none, strong, weak
+    Directories holding the wav files of one class, in traversal order.
     """
     path = data_path #
-    audio = []
-    l1 = os.listdir(path)
+    wav_dirs = []
+    l1 = listdir(path)
     for dir in l1:
-        l2 = os.listdir(os.path.join(path, dir))
+        l2 = listdir(os.path.join(path, dir))
         for dir1 in l2:
-            wav_dir = os.path.join(path, split, dir1, '*.wav') 
-            audio.append(glob.glob(wav_dir))
+            wav_dirs.append(os.path.join(path, split, dir1))
+    return wav_dirs
+
+
+def get_wav_name(split='strong', data_path='./', manifest=None):
+    """
+    params: str
+        middle, none, strong, weak
+    manifest: DatasetManifest to read the listing from instead of walking the tree
+    """
+    if manifest is not None:
+        return manifest.wav_names(split)
+    audio = []
+    for wav_dir in get_wav_dirs(split=split, data_path=data_path):
+        audio.append(glob.glob(os.path.join(wav_dir, '*.wav')))
     return list(chain.from_iterable(audio))
 
 
-def data_generator(seed, test_sample_per_class, data_path='./'):
+def load_manifest(manifest_path, data_path='./'):
+    """Load the persisted dataset manifest, refreshing it for recordings added since it was written."""
+    return DatasetManifest(manifest_path, data_path, CLASS_NAMES, get_wav_dirs)
+
+
+def data_generator(seed, test_sample_per_class, data_path='./', manifest=None):
     """
     class to label mapping:
     none: 0
@@ -46,15 +70,16 @@ def data_generator(seed, test_sample_per_class, data_path='./'):
     - seed: random seed for shuffling
     - test_sample_per_class: number of samples per class to use for testing
     - data_path: path to the dataset
+    - manifest: DatasetManifest providing the file lists (None walks the tree)
     - selected_classes: list of classes to include in the data (e.g., [0, 3]). 
                         If None, use all classes.
     """
 
     random_state = np.random.RandomState(seed)
-    strong_list = get_wav_name(split='strong', data_path=data_path)
-    medium_list = get_wav_name(split='middle', data_path=data_path)
-    weak_list = get_wav_name(split='weak', data_path=data_path)
-    none_list = get_wav_name(split='none', data_path=data_path)
+    strong_list = get_wav_name(split='strong', data_path=data_path, manifest=manifest)
+    medium_list = get_wav_name(split='middle', data_path=data_path, manifest=manifest)
+    weak_list = get_wav_name(split='weak', data_path=data_path, manifest=manifest)
+    none_list = get_wav_name(split='none', data_path=data_path, manifest=manifest)
 
     random_state.shuffle(strong_list)
     random_state.shuffle(medium_list)
@@ -104,10 +129,13 @@ def data_generator(seed, test_sample_per_class, data_path='./'):
 
     
 class Fish_Voice_Dataset(Dataset):
-    def __init__(self, sample_rate, seed, class_num, split='train', data_path='./', transform=None):
+    def __init__(self, sample_rate, seed, class_num, split='train', data_path='./', transform=None, store_path=None, resampler='fft', manifest=None):
         """
         split: train or test
         if sample_rate=None, read audio with the default sr
+        store_path: root of the pre-decoded waveform store, built on first use (None reads the wav files)
+        resampler: resampling engine for load_audio (fft, poly, torch)
+        manifest: DatasetManifest (see load_manifest) used instead of walking the tree (None walks it)
         """
         self.seed = seed
         self.split = split
@@ -115,13 +143,19 @@ class Fish_Voice_Dataset(Dataset):
         self.transform = transform
         self.class_num = class_num
 
-        train_dict, test_dict = data_generator(self.seed, test_sample_per_class=100, data_path=self.data_path)
+        train_dict, test_dict = data_generator(self.seed, test_sample_per_class=100, data_path=self.data_path, manifest=manifest)
         
         if split == 'train':
             self.data_dict = train_dict
         elif split == 'test' or split == 'val':
             self.data_dict = test_dict
         self.sample_rate = sample_rate
+        self.resampler = resampler
+
+        self.store = None
+        if store_path is not None:
+            all_wavs = [wav for wav, _ in chain(train_dict, test_dict)]
+            self.store = open_waveform_store(store_path, all_wavs, self.sample_rate, load_audio, resampler=self.resampler)
     
     def __len__(self):
 
@@ -129,12 +163,15 @@ class Fish_Voice_Dataset(Dataset):
         return len(self.data_dict)
     
     def __getitem__(self, index):
-        wav_name, target = self.data_dict[index]
-        wav = load_audio(wav_name, sr=self.sample_rate)
+        wav_name, label = self.data_dict[index]
+        if self.store is not None:
+            wav = self.store[wav_name]
+        else:
+            wav = load_audio(wav_name, sr=self.sample_rate, resampler=self.resampler)
 
-        # wav, _ = torchaudio.load(wav_name, normalize=True)
+            # wav, _ = torchaudio.load(wav_name, normalize=True)
 
-        wav = np.array(wav)
+            wav = np.array(wav)
 
         if self.transform is not None:
             wav = self.transform(samples=wav, sample_rate=2*self.sample_rate)
@@ -145,9 +182,9 @@ class Fish_Voice_Dataset(Dataset):
         # print(wav.shape)
 
         # change 'eye(num)' if using different class nums
-        target = np.eye(self.class_num)[target]
+        target = np.eye(self.class_num)[label]
 
-        data_dict = {'audio_name': wav_name, 'waveform': wav, 'target': target}
+        data_dict = {'audio_name': wav_name, 'waveform': wav, 'target': target, 'label': label}
 
         return data_dict
 
@@ -173,13 +210,26 @@ def get_dataloader(split,
                    class_num=4,
                    data_path='./',
                    sampler=None,
-                   transform=None):
-
-    dataset = Fish_Voice_Dataset(split=split, sample_rate=sample_rate, seed=seed, class_num=class_num, data_path=data_path, transform=transform)
+                   transform=None,
+                   store_path=None,
+                   resampler='fft',
+                   manifest=None,
+                   fast_collate=False):
+
+    dataset = Fish_Voice_Dataset(split=split, sample_rate=sample_rate, seed=seed, class_num=class_num, data_path=data_path, transform=transform, store_path=store_path, resampler=resampler, manifest=manifest)
+
+    if fast_collate:
+        # Pinned ring buffers when collating in the main process, DataLoader pinning otherwise
+        pin_memory = torch.cuda.is_available()
+        collate = BatchCollator(pin_memory=pin_memory and num_workers == 0)
+    else:
+        pin_memory = False
+        collate = collate_fn
 
     dataloader = DataLoader(dataset=dataset, batch_size=batch_size,
                       shuffle=shuffle, drop_last=drop_last,
-                      num_workers=num_workers, sampler=sampler, collate_fn=collate_fn)
+                      num_workers=num_workers, sampler=sampler, collate_fn=collate,
+                      pin_memory=pin_memory and num_workers > 0)
 
     return dataset, dataloader
 
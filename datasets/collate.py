@@ -0,0 +1,102 @@
+# File: datasets/collate.py
+
+import time
+import argparse
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+
+class BatchCollator:
+    """
+    Collate that writes every waveform straight into one preallocated batch tensor.
+
+    Compared to ``collate_fn`` (list -> np.array -> torch.FloatTensor), each
+    sample is copied exactly once, and targets are carried as int64 class
+    labels instead of one-hot float rows.
+
+    When collating in the main process (num_workers=0) with pin_memory=True,
+    batches are written into a ring of ``num_buffers`` reusable pinned
+    buffers, so host-to-device copies can be non-blocking and no pinned
+    memory is allocated per step. A batch stays valid until ``num_buffers``
+    further batches have been collated. In DataLoader workers a fresh tensor
+    is allocated per batch and pinning is left to the DataLoader.
+    """
+
+    def __init__(self, pin_memory=False, num_buffers=2):
+        self.pin_memory = pin_memory
+        self.num_buffers = num_buffers
+        self._buffers = []
+        self._next = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_buffers'] = []
+        return state
+
+    def _buffer(self, batch_size, length, dtype):
+        if not self.pin_memory or get_worker_info() is not None:
+            return torch.empty((batch_size, length), dtype=dtype)
+
+        slot = self._next % self.num_buffers
+        self._next += 1
+        if slot < len(self._buffers):
+            buffer = self._buffers[slot]
+            if buffer.shape[1] == length and buffer.shape[0] >= batch_size and buffer.dtype == dtype:
+                return buffer[:batch_size]
+        buffer = torch.empty((batch_size, length), dtype=dtype, pin_memory=True)
+        if slot < len(self._buffers):
+            self._buffers[slot] = buffer
+        else:
+            self._buffers.append(buffer)
+        return buffer
+
+    def __call__(self, batch):
+        wav_name = [data['audio_name'] for data in batch]
+        length = batch[0]['waveform'].shape[-1]
+
+        wav = self._buffer(len(batch), length, torch.float32)
+        wav_np = wav.numpy()
+        for i, data in enumerate(batch):
+            wav_np[i] = data['waveform']
+
+        target = torch.tensor([data['label'] for data in batch], dtype=torch.long)
+
+        return {'audio_name': wav_name, 'waveform': wav, 'target': target}
+
+
+def benchmark(batch_size=200, length=256000, num_classes=4, steps=10):
+    """Time collate_fn against BatchCollator on synthetic float64 waveforms (as returned by the fft resampler)."""
+    from datasets.affia3k import collate_fn
+
+    rng = np.random.RandomState(0)
+    batch = []
+    for i in range(batch_size):
+        label = i % num_classes
+        batch.append({'audio_name': f'clip_{i}.wav', 'waveform': rng.randn(length),
+                      'target': np.eye(num_classes)[label], 'label': label})
+
+    collators = [('collate_fn', collate_fn), ('BatchCollator', BatchCollator())]
+    if torch.cuda.is_available():
+        collators.append(('BatchCollator (pinned)', BatchCollator(pin_memory=True)))
+
+    print(f"Collating {batch_size} x {length} samples, {steps} steps")
+    for name, collate in collators:
+        collate(batch)
+        start = time.perf_counter()
+        for _ in range(steps):
+            out = collate(batch)
+        elapsed = (time.perf_counter() - start) / steps
+        print(f"  {name:>24}: {elapsed * 1000:8.1f} ms/batch, waveform {tuple(out['waveform'].shape)}, "
+              f"target {out['target'].dtype}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batch collation')
+    parser.add_argument('--batch_size', type=int, default=200)
+    parser.add_argument('--length', type=int, default=256000)
+    parser.add_argument('--steps', type=int, default=10)
+    args = parser.parse_args()
+
+    benchmark(batch_size=args.batch_size, length=args.length, steps=args.steps)
@@ -1,7 +1,7 @@
 # File: datasets/dataset_selection.py
 
-from .affia3k import get_dataloader as affia3k_loader
-from .uffia import get_dataloader as uffia_loader
+from .affia3k import get_dataloader as affia3k_loader, load_manifest as affia3k_manifest
+from .uffia import get_dataloader as uffia_loader, load_manifest as uffia_manifest
 
 def get_dataloaders(args, transform):
     """
@@ -17,6 +17,8 @@ def get_dataloaders(args, transform):
         val_loader: DataLoader for the validation dataset.
     """
     if args.dataset == 'affia3k':
+        # Loaded and refreshed once, shared by both splits
+        manifest = affia3k_manifest(args.manifest, args.data_path) if args.manifest is not None else None
         train_dataset, train_loader = affia3k_loader(
             split='train',
             batch_size=args.batch_size,
@@ -26,7 +28,11 @@ def get_dataloaders(args, transform):
             class_num=args.num_classes,
             drop_last=True,
             data_path=args.data_path,
-            transform=transform
+            transform=transform,
+            store_path=args.waveform_store,
+            resampler=args.resampler,
+            manifest=manifest,
+            fast_collate=args.fast_collate
         )
         val_dataset, val_loader = affia3k_loader(
             split='test',
@@ -37,9 +43,14 @@ def get_dataloaders(args, transform):
             class_num=args.num_classes,
             drop_last=False,
             data_path=args.data_path,
-            transform=None  # Typically, no augmentation for validation
+            transform=None,  # Typically, no augmentation for validation
+            store_path=args.waveform_store,
+            resampler=args.resampler,
+            manifest=manifest,
+            fast_collate=args.fast_collate
         )
     elif args.dataset == 'uffia':
+        manifest = uffia_manifest(args.manifest, args.data_path) if args.manifest is not None else None
         train_dataset, train_loader = uffia_loader(
             split='train',
             batch_size=args.batch_size,
@@ -49,7 +60,11 @@ def get_dataloaders(args, transform):
             class_num=args.num_classes,
             drop_last=True,
             data_path=args.data_path,
-            transform=transform
+            transform=transform,
+            store_path=args.waveform_store,
+            resampler=args.resampler,
+            manifest=manifest,
+            fast_collate=args.fast_collate
         )
         val_dataset, val_loader = uffia_loader(
             split='test',
@@ -60,7 +75,11 @@ def get_dataloaders(args, transform):
             class_num=args.num_classes,
             drop_last=False,
             data_path=args.data_path,
-            transform=None
+            transform=None,
+            store_path=args.waveform_store,
+            resampler=args.resampler,
+            manifest=manifest,
+            fast_collate=args.fast_collate
         )
     else:
         raise ValueError(f"Unsupported dataset: {args.dataset}")
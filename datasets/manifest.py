@@ -0,0 +1,165 @@
+# File: datasets/manifest.py
+
+import os
+import json
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+import soundfile as sf
+
+
+class DatasetManifest:
+    """
+    Persisted listing of a dataset tree with per-file metadata.
+
+    Stores, for every wav file: class, native sample rate, duration, byte
+    size and mtime, together with the directory listings needed to reproduce
+    the order ``get_wav_name`` produces. On load, every recorded directory is
+    stat'ed; only directories whose mtime changed are listed again, and only
+    the files of those directories are stat'ed and, when new or modified,
+    probed. Files of unchanged directories keep their recorded metadata, so
+    adding recordings refreshes the manifest incrementally (a file rewritten
+    in place, which leaves its directory's mtime alone, needs a fresh
+    manifest).
+
+    params:
+        manifest_path: json file the manifest is persisted to
+        data_path: dataset root
+        class_names: class folders, e.g. ['strong', 'middle', 'weak', 'none']
+        wav_dirs_fn: callable(split, data_path, listdir) returning the
+            directories holding the wav files of one class, in traversal order
+        pattern: file pattern matched inside the wav directories
+        num_workers: threads used for directory listing and file probing
+    """
+
+    def __init__(self, manifest_path, data_path, class_names, wav_dirs_fn, pattern='*.wav', num_workers=16):
+        self.manifest_path = manifest_path
+        self.data_path = data_path
+        self.class_names = list(class_names)
+        self.wav_dirs_fn = wav_dirs_fn
+        self.pattern = pattern
+        self.num_workers = num_workers
+
+        self.listings = {}
+        self.files = {}
+        self.classes = {}
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest['data_path'] == data_path and manifest['pattern'] == pattern:
+                self.listings = manifest['listings']
+                self.files = manifest['files']
+
+        self.refresh()
+
+    def _stat_mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _list(self, path, mtime):
+        if mtime is None:
+            return None
+        with os.scandir(path) as it:
+            return [entry.name for entry in it]
+
+    def _listdir(self, path, missing_ok=False):
+        listing = self._fresh[path] if path in self._fresh else self._update_listing(path)
+        if listing['entries'] is None:
+            if missing_ok:
+                return []
+            raise FileNotFoundError(f"No such directory: '{path}'")
+        return listing['entries']
+
+    def _update_listing(self, path):
+        mtime = self._stat_mtime(path)
+        cached = self.listings.get(path)
+        if cached is None or cached['mtime'] != mtime:
+            cached = {'mtime': mtime, 'entries': self._list(path, mtime)}
+            self._relisted.add(path)
+            self._changed = True
+        self._fresh[path] = cached
+        return cached
+
+    def _probe(self, path, split):
+        stat = os.stat(path)
+        cached = self.files.get(path)
+        if cached is not None and cached['bytes'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+            return path, cached
+        try:
+            info = sf.info(path)
+            sample_rate, duration = info.samplerate, info.duration
+        except RuntimeError:
+            sample_rate, duration = None, None
+        self._changed = True
+        return path, {'class': split, 'sample_rate': sample_rate, 'duration': duration,
+                      'bytes': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    def refresh(self):
+        """Re-list changed directories, probe their new or modified files and persist the result."""
+        self._fresh = {}
+        self._relisted = set()
+        self._changed = False
+
+        wav_dirs = {split: self.wav_dirs_fn(split, self.data_path, listdir=self._listdir)
+                    for split in self.class_names}
+
+        unique_dirs = list(dict.fromkeys(d for dirs in wav_dirs.values() for d in dirs))
+        with ThreadPoolExecutor(self.num_workers) as pool:
+            list(pool.map(self._update_listing, [d for d in unique_dirs if d not in self._fresh]))
+
+        self.classes = {}
+        files = {}
+        to_probe = {}
+        for split, dirs in wav_dirs.items():
+            names = []
+            for wav_dir in dirs:
+                entries = self._listdir(wav_dir, missing_ok=True)
+                for name in entries:
+                    if not name.startswith('.') and fnmatch.fnmatch(name, self.pattern):
+                        path = os.path.join(wav_dir, name)
+                        names.append(path)
+                        # Unchanged listing: the recorded metadata is reused without a stat
+                        if wav_dir not in self._relisted and path in self.files:
+                            files[path] = self.files[path]
+                        else:
+                            to_probe[path] = split
+            self.classes[split] = names
+
+        with ThreadPoolExecutor(self.num_workers) as pool:
+            files.update(pool.map(lambda item: self._probe(*item), to_probe.items()))
+
+        if len(files) != len(self.files) or len(self._fresh) != len(self.listings):
+            self._changed = True
+        self.files = files
+        self.listings = self._fresh
+        del self._fresh, self._relisted
+
+        if self._changed:
+            self.save()
+        return self
+
+    def save(self):
+        manifest = {
+            'data_path': self.data_path,
+            'pattern': self.pattern,
+            'listings': self.listings,
+            'files': self.files,
+        }
+        manifest_dir = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(manifest_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def wav_names(self, split):
+        """Wav paths of one class, in the same order as get_wav_name."""
+        return list(self.classes[split])
+
+    def records(self, split=None):
+        """Metadata records (path, class, sample_rate, duration, bytes, mtime) of one or all classes."""
+        paths = self.classes[split] if split is not None else self.files
+        return [dict(path=path, **self.files[path]) for path in dict.fromkeys(paths)]
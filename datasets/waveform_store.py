@@ -0,0 +1,172 @@
+# File: datasets/waveform_store.py
+
+import os
+import json
+import argparse
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+
+INDEX_NAME = 'index.json'
+
+
+def store_key(sample_rate, num_samples, resampler='fft'):
+    """Sub-directory name of a store built for a given sample rate, clip length and resampler."""
+    return f'sr{sample_rate}_n{num_samples}_{resampler}'
+
+
+def _decode(path, load_fn, sample_rate, resampler):
+    return np.asarray(load_fn(path, sr=sample_rate, resampler=resampler), dtype=np.float32)
+
+
+class WaveformStore:
+    """
+    Pre-decoded, resampled waveforms kept in contiguous memory-mapped shards.
+
+    Every clip is decoded and resampled once, then written as a row of a
+    (num_clips, num_samples) float32 ``.npy`` shard. Reading a clip is a
+    zero-copy slice of the memory map, so no decoding or resampling happens
+    after the store has been built.
+
+    Layout on disk:
+        <root>/sr<sample_rate>_n<num_samples>_<resampler>/index.json
+        <root>/sr<sample_rate>_n<num_samples>_<resampler>/shard_00000.npy
+        ...
+    """
+
+    def __init__(self, root, sample_rate, num_samples, resampler='fft'):
+        self.root = root
+        self.sample_rate = sample_rate
+        self.num_samples = num_samples
+        self.resampler = resampler
+        self.store_dir = os.path.join(root, store_key(sample_rate, num_samples, resampler))
+        self.shards = []
+        self.entries = {}
+        self._maps = {}
+
+        index_path = os.path.join(self.store_dir, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            self.shards = index['shards']
+            self.entries = {path: tuple(loc) for path, loc in index['entries'].items()}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def __getstate__(self):
+        # Memory maps are re-opened lazily in every DataLoader worker
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        return state
+
+    def missing(self, paths):
+        return [path for path in dict.fromkeys(paths) if path not in self.entries]
+
+    def build(self, paths, load_fn, shard_size=2048, num_workers=8):
+        """
+        Decode and resample every path not yet in the store and append them as new shards.
+
+        params:
+            paths: audio files to store
+            load_fn: callable(path, sr, resampler) returning a waveform of ``num_samples`` samples
+            shard_size: maximum number of clips per shard
+            num_workers: number of decoding processes
+        """
+        todo = self.missing(paths)
+        if not todo:
+            return self
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        decode = partial(_decode, load_fn=load_fn, sample_rate=self.sample_rate, resampler=self.resampler)
+
+        with Pool(num_workers) as pool:
+            for start in range(0, len(todo), shard_size):
+                chunk = todo[start:start + shard_size]
+                shard_idx = len(self.shards)
+                shard_name = f'shard_{shard_idx:05d}.npy'
+                shard = np.lib.format.open_memmap(
+                    os.path.join(self.store_dir, shard_name), mode='w+',
+                    dtype=np.float32, shape=(len(chunk), self.num_samples))
+
+                for row, wav in enumerate(pool.imap(decode, chunk, chunksize=8)):
+                    if wav.shape[0] != self.num_samples:
+                        raise ValueError(f"Expected {self.num_samples} samples, got {wav.shape[0]} for {chunk[row]}")
+                    shard[row] = wav
+
+                shard.flush()
+                del shard
+
+                self.shards.append(shard_name)
+                for row, path in enumerate(chunk):
+                    self.entries[path] = (shard_idx, row)
+                self._write_index()
+
+                print(f"Waveform store: wrote {shard_name} ({len(chunk)} clips) to {self.store_dir}")
+
+        return self
+
+    def _write_index(self):
+        index = {
+            'sample_rate': self.sample_rate,
+            'num_samples': self.num_samples,
+            'resampler': self.resampler,
+            'dtype': 'float32',
+            'shards': self.shards,
+            'entries': {path: list(loc) for path, loc in self.entries.items()},
+        }
+        tmp_path = os.path.join(self.store_dir, INDEX_NAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.store_dir, INDEX_NAME))
+
+    def _shard(self, shard_idx):
+        if shard_idx not in self._maps:
+            self._maps[shard_idx] = np.load(
+                os.path.join(self.store_dir, self.shards[shard_idx]), mmap_mode='r')
+        return self._maps[shard_idx]
+
+    def __getitem__(self, path):
+        """Read-only, zero-copy view of the stored waveform."""
+        shard_idx, row = self.entries[path]
+        return self._shard(shard_idx)[row]
+
+
+def open_waveform_store(root, paths, sample_rate, load_fn, clip_seconds=2, resampler='fft', num_workers=8):
+    """Open the store for (sample_rate, clip length, resampler), building any missing clips first."""
+    store = WaveformStore(root, sample_rate, int(sample_rate * clip_seconds), resampler=resampler)
+    return store.build(paths, load_fn, num_workers=num_workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the pre-decoded waveform store')
+    parser.add_argument('--dataset', type=str, default='affia3k')
+    parser.add_argument('--data_path', type=str, required=True)
+    parser.add_argument('--store_path', type=str, required=True)
+    parser.add_argument('--manifest', type=str, default=None)
+    parser.add_argument('--sample_rate', type=int, default=128000)
+    parser.add_argument('--seed', type=int, default=20)
+    parser.add_argument('--resampler', type=str, default='fft')
+    parser.add_argument('--num_workers', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.dataset == 'affia3k':
+        from datasets.affia3k import data_generator, load_audio, load_manifest
+        manifest = load_manifest(args.manifest, args.data_path) if args.manifest is not None else None
+        splits = data_generator(args.seed, test_sample_per_class=100, data_path=args.data_path, manifest=manifest)
+    elif args.dataset == 'uffia':
+        from datasets.uffia import data_generator, load_audio, load_manifest
+        manifest = load_manifest(args.manifest, args.data_path) if args.manifest is not None else None
+        splits = data_generator(args.seed, test_sample_per_class=700, data_path=args.data_path, manifest=manifest)
+    else:
+        raise ValueError(f"Unsupported dataset: {args.dataset}")
+
+    paths = [wav for split in splits for wav, _ in split]
+    store = open_waveform_store(args.store_path, paths, args.sample_rate, load_audio,
+                                resampler=args.resampler, num_workers=args.num_workers)
+    print(f"Waveform store at {store.store_dir} holds {len(store)} clips")
@@ -0,0 +1,120 @@
+import time
+
+import numpy as np
+import librosa
+import torch
+import torch.nn as nn
+
+from frontends.precision import fp32_forward
+
+
+class Chroma(nn.Module):
+    def __init__(self, sample_rate, n_fft, hop_length, win_length=None, n_chroma=12, tuning=0.0,
+                 norm=np.inf, window='hann', center=True, pad_mode='constant'):
+        """
+        Batched, on-device librosa.feature.chroma_stft.
+
+        The chroma filterbank and the STFT window are computed once with
+        librosa and kept as buffers; a forward pass is one batched torch.stft,
+        one matmul with the filterbank and a per-frame normalization.
+        Defaults follow librosa.feature.chroma_stft, except tuning, which is
+        fixed instead of estimated from each clip.
+        """
+        super(Chroma, self).__init__()
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.win_length = n_fft if win_length is None else win_length
+        self.norm = norm
+        self.center = center
+        self.pad_mode = pad_mode
+
+        window = librosa.filters.get_window(window, self.win_length, fftbins=True)
+        chromafb = librosa.filters.chroma(sr=sample_rate, n_fft=n_fft, tuning=tuning, n_chroma=n_chroma)
+        self.register_buffer('window', torch.tensor(window, dtype=torch.float), persistent=False)
+        self.register_buffer('chromafb', torch.tensor(chromafb, dtype=torch.float), persistent=False)
+
+    def power_spectrogram(self, x):
+        """
+        x: (batch_size, data_length)
+
+        Returns:
+            (batch_size, n_fft // 2 + 1, time_steps)
+        """
+        s = torch.stft(
+            x,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+            window=self.window,
+            center=self.center,
+            pad_mode=self.pad_mode,
+            return_complex=True,
+        )
+        return s.real ** 2 + s.imag ** 2
+
+    def chroma_from_power(self, power):
+        """
+        power: (batch_size, n_fft // 2 + 1, time_steps)
+
+        Returns:
+            (batch_size, n_chroma, time_steps)
+        """
+        raw_chroma = torch.matmul(self.chromafb, power)
+        if self.norm is None:
+            return raw_chroma
+        # librosa.util.normalize: frames whose norm is below the smallest normal float are left as is
+        length = torch.linalg.vector_norm(raw_chroma, ord=self.norm, dim=-2, keepdim=True)
+        length = torch.where(length < torch.finfo(length.dtype).tiny, torch.ones_like(length), length)
+        return raw_chroma / length
+
+    @fp32_forward
+    def forward(self, x):
+        """
+        x: (batch_size, data_length)
+
+        Returns:
+            (batch_size, n_chroma, time_steps)
+        """
+        return self.chroma_from_power(self.power_spectrogram(x))
+
+
+def main():
+    sample_rate, n_fft, hop_length, n_chroma = 128000, 2048, 1024, 64
+    batch_size, signal_length = 32, 256000
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    chroma = Chroma(sample_rate, n_fft, hop_length, n_chroma=n_chroma).to(device)
+
+    torch.manual_seed(0)
+    x = torch.randn(batch_size, signal_length) * torch.rand(batch_size, 1)
+
+    # Reference: librosa, clip by clip on the CPU
+    start = time.perf_counter()
+    x_np = x.numpy()
+    reference = np.stack([
+        librosa.feature.chroma_stft(y=x_np[i], sr=sample_rate, n_fft=n_fft, hop_length=hop_length,
+                                    win_length=n_fft, window='hann', n_chroma=n_chroma, tuning=0)
+        for i in range(batch_size)
+    ], axis=0)
+    librosa_time = time.perf_counter() - start
+
+    x = x.to(device)
+    with torch.no_grad():
+        chroma(x)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        features = chroma(x)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        torch_time = time.perf_counter() - start
+
+    error = np.abs(features.cpu().numpy() - reference).max()
+    print(f"Chroma {tuple(features.shape)} on {device}")
+    print(f"  librosa per clip: {librosa_time * 1000:8.1f} ms")
+    print(f"  batched torch:    {torch_time * 1000:8.1f} ms ({librosa_time / torch_time:.1f}x)")
+    print(f"  max abs difference: {error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
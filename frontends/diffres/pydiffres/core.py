@@ -57,6 +57,10 @@ class Base(nn.Module):
         )(torch.zeros((1, self.input_seq_length, self.input_f_dim)))
         self.pos_emb = nn.Parameter(pos_emb_y, requires_grad=learn_pos_emb)
 
+        # Odd / even output lines of the scatter pooling: parity and last bin of each
+        self.register_buffer("line_parity", torch.tensor([1, 0]), persistent=False)
+        self.register_buffer("line_limits", self.odd_even_limits(self.output_seq_length), persistent=False)
+
     def forward(self):
         raise NotImplementedError
 
@@ -133,7 +137,7 @@ class Base(nn.Module):
         cumsum = torch.cumsum(score, dim=1)
         
         # Handle floating point precision issues
-        cumsum[cumsum % 1 < 1e-2] -= 1e-2
+        cumsum = torch.where(cumsum % 1 < 1e-2, cumsum - 1e-2, cumsum)
 
         int_cumsum = torch.floor(cumsum.float()).permute(0, 2, 1).long()
         int_cumsum = torch.clip(int_cumsum, min=0, max=out_len - 1)
@@ -146,7 +150,7 @@ class Base(nn.Module):
         
         # Perform scatter_max using scatter_reduce
         # Since scatter_reduce does not return values and indices, we'll use scatter_reduce_ for in-place operation
-        out.scatter_reduce_(dim=2, index=int_cumsum, src=src, reduce='amax')  # 'amax' is used for max
+        out.scatter_reduce_(dim=2, index=int_cumsum.expand(-1, feat_dim, -1), src=src, reduce='amax')  # 'amax' is used for max
         
         return out.permute(0, 2, 1) * (1 / (1 - self.dimension_reduction_rate))
 
@@ -156,7 +160,7 @@ class Base(nn.Module):
         cumsum = torch.cumsum(score, dim=1)
         
         # Handle floating point precision issues
-        cumsum[cumsum % 1 < 1e-2] -= 1e-2
+        cumsum = torch.where(cumsum % 1 < 1e-2, cumsum - 1e-2, cumsum)
 
         int_cumsum = torch.floor(cumsum.float()).permute(0, 2, 1).long()
         int_cumsum = torch.clip(int_cumsum, min=0, max=out_len - 1)
@@ -168,7 +172,7 @@ class Base(nn.Module):
         src = (feature * score).permute(0, 2, 1)  # Shape: [bs, feat_dim, in_seq_len]
         
         # Perform scatter_add using scatter_reduce
-        out.scatter_reduce_(dim=2, index=int_cumsum, src=src, reduce='sum')
+        out.scatter_reduce_(dim=2, index=int_cumsum.expand(-1, feat_dim, -1), src=src, reduce='sum')
         
         return out.permute(0, 2, 1)
 
@@ -201,39 +205,51 @@ class Base(nn.Module):
         return value == 1, value == -1
 
     def calculate_scatter_maxpool_odd_even_lines(self, weight, feature, out_len):
-        odd_score, odd_index = self.select_odd_dimensions(weight)
-        even_score, even_index = self.select_even_dimensions(weight)
-        out_odd = self.calculate_scatter_maxpool(
-            odd_score, feature, out_len=int(torch.sum(odd_index).item())
-        )
-        out_even = self.calculate_scatter_maxpool(
-            even_score, feature, out_len=int(torch.sum(even_index).item())
-        )
+        odd_score, _ = self.select_odd_dimensions(weight)
+        even_score, _ = self.select_even_dimensions(weight)
+        return self.scatter_maxpool_odd_even_scores(odd_score, even_score, feature, out_len)
 
-        assert out_odd.size(1) + out_even.size(1) == out_len
+    def calculate_scatter_avgpool_odd_even_lines(self, weight, feature, out_len):
+        odd_score, _ = self.select_odd_dimensions(weight)
+        even_score, _ = self.select_even_dimensions(weight)
+        return self.scatter_pool_odd_even_lines(odd_score, even_score, feature, out_len, reduce='sum')
 
-        out = torch.zeros(out_odd.size(0), out_len, out_odd.size(2)).to(feature.device)
-        out[:, even_index, :] = out_even
-        out[:, odd_index, :] = out_odd
-        return out
+    def scatter_maxpool_odd_even_scores(self, odd_score, even_score, feature, out_len):
+        out = self.scatter_pool_odd_even_lines(odd_score, even_score, feature, out_len, reduce='amax')
+        return out * (1 / (1 - self.dimension_reduction_rate))
 
-    def calculate_scatter_avgpool_odd_even_lines(self, weight, feature, out_len):
-        odd_score, odd_index = self.select_odd_dimensions(weight)
-        even_score, even_index = self.select_even_dimensions(weight)
+    @staticmethod
+    def odd_even_limits(out_len):
+        # Last bin of the odd and of the even output lines
+        return torch.tensor([out_len // 2 - 1, (out_len + 1) // 2 - 1])
 
-        out_odd = self.calculate_scatter_avgpool(
-            odd_score, feature, out_len=int(torch.sum(odd_index).item())
-        )
-        out_even = self.calculate_scatter_avgpool(
-            even_score, feature, out_len=int(torch.sum(even_index).item())
-        )
+    def scatter_pool_odd_even_lines(self, odd_score, even_score, feature, out_len, reduce):
+        """
+        Scatter pooling of the odd and the even output lines in a single pass.
 
-        assert out_odd.size(1) + out_even.size(1) == out_len
+        Same result as pooling each set of lines with calculate_scatter_maxpool /
+        calculate_scatter_avgpool and interleaving them: bin b of the odd lines
+        is output line 2b + 1, bin b of the even lines is line 2b.
+        """
+        bs, in_seq_len, feat_dim = feature.size()
+        if out_len == self.output_seq_length:
+            limits = self.line_limits
+        else:
+            limits = self.odd_even_limits(out_len).to(feature.device)
 
-        out = torch.zeros(out_odd.size(0), out_len, out_odd.size(2)).to(feature.device)
-        out[:, even_index, :] = out_even
-        out[:, odd_index, :] = out_odd
-        return out
+        score = torch.cat([odd_score, even_score], dim=2)  # [bs, in_seq_len, 2]
+        cumsum = torch.cumsum(score, dim=1)
+        # Handle floating point precision issues
+        cumsum = torch.where(cumsum % 1 < 1e-2, cumsum - 1e-2, cumsum)
+        bins = torch.minimum(torch.floor(cumsum.float()).long().clamp(min=0), limits)
+        index = (2 * bins + self.line_parity).permute(0, 2, 1).reshape(bs, 1, 2 * in_seq_len)
+
+        src = (feature.unsqueeze(2) * score.unsqueeze(-1)).permute(0, 3, 2, 1)  # [bs, feat_dim, 2, in_seq_len]
+        out = torch.zeros((bs, feat_dim, out_len), device=feature.device, dtype=src.dtype)
+        out = out.scatter_reduce(
+            2, index.expand(-1, feat_dim, -1), src.reshape(bs, feat_dim, 2 * in_seq_len), reduce=reduce
+        )
+        return out.permute(0, 2, 1)
 
     def select_odd_dimensions(self, weight):
         # torch.Size([1, 10, 5])
@@ -260,52 +276,130 @@ class Base(nn.Module):
 
         ####################################################################
         # If the weight for one frame is greater than one, rescale the batch
-        max_val = torch.max(score, dim=1)[0]
-        max_val = max_val[..., 0]
+        max_val = torch.max(score, dim=1, keepdim=True)[0]
         dims_need_norm = max_val >= 1
-        if torch.sum(dims_need_norm) > 0:
-            score[dims_need_norm] = (
-                score[dims_need_norm] / max_val[dims_need_norm][..., None, None]
-            )
+        score = torch.where(dims_need_norm, score / max_val, score)
         ####################################################################
 
         ####################################################################
-        # Remove the zero pad at the end, using the rescaling of the weight in between
+        # Remove the zero pad at the end, using the rescaling of the weight in between.
+        # Applied to rows that lost at least one frame of length, and only when
+        # some row of the batch was rescaled above (no host sync on either test).
         # torch.Size([32, 1056, 1])
-        if torch.sum(dims_need_norm) > 0:
-            sum_score = torch.sum(score, dim=(1, 2), keepdim=True)
-            distance_with_target_length = (total_length - sum_score)[:, 0, 0]
-            axis = torch.logical_and(
-                score < RESCALE_INTERVEL_MAX, score > RESCALE_INTERVEL_MIN
-            )  # TODO here 0.1 or RESCALE_INTERVEL_MIN
-            for i in range(score.size(0)):
-                if distance_with_target_length[i] >= 1:
-                    intervel = 1.0 - score[i][axis[i]]
-                    alpha = distance_with_target_length[i] / torch.sum(intervel)
-                    if alpha > 1:
-                        alpha = 1
-                    score[i][axis[i]] += intervel * alpha
+        sum_score = torch.sum(score, dim=(1, 2), keepdim=True)
+        distance_with_target_length = total_length - sum_score
+        rows = torch.logical_and(distance_with_target_length >= 1, torch.any(dims_need_norm))
+        axis = torch.logical_and(
+            score < RESCALE_INTERVEL_MAX, score > RESCALE_INTERVEL_MIN
+        )  # TODO here 0.1 or RESCALE_INTERVEL_MIN
+        intervel = torch.where(axis, 1.0 - score, torch.zeros_like(score))
+        sum_intervel = torch.sum(intervel, dim=(1, 2), keepdim=True)
+        # An empty interval set adds nothing; keep the division finite for the gradient
+        alpha = distance_with_target_length / torch.where(
+            sum_intervel > 0, sum_intervel, torch.ones_like(sum_intervel)
+        )
+        alpha = torch.clamp(alpha, max=1.0)
+        score = torch.where(rows, score + intervel * alpha, score)
         ####################################################################
         return score, total_length
 
     def update_weight(self, weight):
-        # Slow version
+        """
+        Make every output frame's weights sum to one.
+
+        For monotonic-expansion weights (each output frame covers a contiguous
+        run of input frames, starting where the previous one ended) the missing
+        mass of output frame i is the running sum f_i of (1 - row sum) over
+        frames <= i: it is written on the first input frame after frame i's run
+        and taken from frame i + 1 on that input frame. The last output frame and
+        runs reaching the final input frame are left untouched.
+
+        weight: (batch_size, in_seq_len, out_seq_len)
+        """
         weight = weight.permute(0, 2, 1)
         bs, gamma, m = weight.size()
-        for b in range(bs):
-            i, j, s = 0, 0, 0
-            while i < gamma - 1 and j < m - 1:
-                if weight[b, i, j] > 0:
-                    s += weight[b, i, j]
-                    j += 1
-                    continue
-                else:
-                    weight[b, i, j] = 1 - s
-                    weight[b, i + 1, j] -= weight[b, i, j]
-                    i += 1
-                    s = 0
+        columns = torch.arange(m, device=weight.device)
+
+        # First input frame after every output frame's run
+        last = torch.amax(torch.where(weight > 0, columns, torch.zeros_like(columns)), dim=-1)
+        end = last + 1
+        rows = torch.arange(gamma, device=weight.device)
+        valid = torch.logical_and(rows < gamma - 1, end < m - 1)
+
+        fill = torch.cumsum(1 - torch.sum(weight, dim=-1), dim=-1)
+        fill = torch.where(valid, fill, torch.zeros_like(fill))
+        update = (columns == end[..., None]) * fill[..., None]  # (bs, gamma, m)
+        weight = weight + update - torch.nn.functional.pad(update, (0, 0, 1, 0))[:, :-1]
         return weight.permute(0, 2, 1)
 
+    def calculate_banded_weight(self, score, total_length):
+        """
+        Banded form of calculate_weight, without the dense (bs, in_seq_len, out_seq_len) tensor.
+
+        Input frame t has non-zero weight in at most two output frames: its own,
+        k_t = ceil(cumsum_t) - 1, and, when it opens a new run, the output frame
+        of the previous run, which receives the remainder making that frame's
+        weights sum to one. Scattering the weights into their indices gives
+        calculate_weight back.
+
+        Returns:
+            index: (bs, in_seq_len, 2) output frames, total_length marks an empty slot
+            weight: (bs, in_seq_len, 2)
+        """
+        score = score[..., 0]
+        bs, in_seq_len = score.size()
+        cumsum = torch.cumsum(score, dim=1)
+        own = torch.ceil(cumsum).long() - 1
+        prev = torch.nn.functional.pad(own, (1, 0), value=-1)[:, :-1]
+        own_valid = torch.logical_and(own >= 0, own < total_length)
+        prev_valid = torch.logical_and(prev >= 0, prev < total_length)
+        new_run = own != prev
+        new_run[:, 0] = False
+
+        # Running remainder of every output frame, as in calculate_weight
+        empty = torch.full_like(own, total_length)
+        own_index = torch.where(own_valid, own, empty)
+        weight_sum = torch.zeros(bs, total_length + 1, device=score.device, dtype=score.dtype)
+        weight_sum = weight_sum.scatter_add(1, own_index, score)[:, :total_length]
+        remainder = torch.cumsum(1 - weight_sum, dim=1)
+        remainder = torch.nn.functional.pad(remainder, (0, 1))
+
+        # The first frame of a run gives back the previous frames' remainder,
+        # the first frame after a run receives it
+        need_minus = torch.logical_and(torch.logical_and(new_run, own_valid), own >= 1)
+        minus = torch.gather(remainder, 1, torch.where(need_minus, own - 1, empty))
+        own_weight = torch.where(own_valid, score - minus, torch.zeros_like(score))
+
+        need_add = torch.logical_and(new_run, prev_valid)
+        prev_index = torch.where(need_add, prev, empty)
+        prev_weight = torch.gather(remainder, 1, prev_index)
+
+        index = torch.stack([own_index, prev_index], dim=-1)
+        weight = torch.clip(torch.stack([own_weight, prev_weight], dim=-1), min=0.0, max=1.0)
+        return index, weight
+
+    def banded_matmul(self, index, weight, feature, total_length):
+        """weight_dense.permute(0, 2, 1) @ feature for a banded weight, as a segment sum."""
+        bs, in_seq_len, _ = index.size()
+        feat_dim = feature.size(-1)
+        src = weight.unsqueeze(-1) * feature.expand(bs, -1, -1).unsqueeze(2)  # (bs, in, 2, feat)
+        out = torch.zeros(bs, total_length + 1, feat_dim, device=feature.device, dtype=src.dtype)
+        out = out.scatter_add(
+            1,
+            index.reshape(bs, -1, 1).expand(-1, -1, feat_dim),
+            src.reshape(bs, -1, feat_dim),
+        )
+        return out[:, :total_length]
+
+    def banded_odd_even_scores(self, index, weight, total_length):
+        """Banded select_odd_dimensions / select_even_dimensions: (bs, in_seq_len, 1) each."""
+        used = index < total_length
+        odd = torch.logical_and(used, index % 2 == 1)
+        even = torch.logical_and(used, index % 2 == 0)
+        odd_score = torch.sum(weight * odd, dim=-1, keepdim=True)
+        even_score = torch.sum(weight * even, dim=-1, keepdim=True)
+        return odd_score, even_score
+
     def calculate_weight(self, score, feature, total_length):
         # Monotonic Expansion
         cumsum_score = torch.cumsum(score, dim=1)
@@ -337,32 +431,35 @@ class Base(nn.Module):
         # If the mel spectrogram is in log scale
         # mel: [bs, t-steps, f-bins]
         # importance_score: [bs, t-steps, 1]
-        if torch.min(mel) < 0:
-            x = mel.exp()
-        else:
-            x = mel
+        # Batched without host syncs: examples whose masked mean (or unmasked std)
+        # is undefined are dropped with masks instead of skipped in a Python loop
+        is_log = torch.min(mel) < 0
+        x = torch.where(is_log, torch.where(is_log, mel, torch.zeros_like(mel)).exp(), mel)
         score_mask = torch.mean(x, dim=-1, keepdim=True)
         score_mask = score_mask < (torch.min(score_mask) + 1e-6)
 
-        guide_loss_final = self.zero_loss_like(mel)
-        activeness_final = self.zero_loss_like(mel)
-
-        for id in range(importance_score.size(0)):
-            guide_loss = torch.mean(importance_score[id][score_mask[id]])
-            if torch.isnan(guide_loss).item():
-                continue
-            
-            if guide_loss > (1-self.dimension_reduction_rate) * 0.5:
-                guide_loss_final = (
-                    guide_loss_final + guide_loss / importance_score.size(0)
-                )
-
-            activeness = torch.std(importance_score[id][~score_mask[id]])
-            if torch.isnan(activeness).item():
-                continue
-            
-            activeness_final = (
-                activeness_final + activeness / importance_score.size(0)
-            )
+        bs = importance_score.size(0)
+        masked = score_mask.to(importance_score.dtype)
+        unmasked = 1.0 - masked
+
+        # mean of the scores of the quietest frames, NaN (skipped) when there are none
+        count = masked.sum(dim=(1, 2))
+        guide_loss = (importance_score * masked).sum(dim=(1, 2)) / count.clamp(min=1)
+        has_guide = count > 0
+        guide_loss = torch.where(
+            has_guide & (guide_loss > (1 - self.dimension_reduction_rate) * 0.5),
+            guide_loss, torch.zeros_like(guide_loss),
+        )
+
+        # unbiased std of the other frames, NaN (skipped) for fewer than two
+        rest = unmasked.sum(dim=(1, 2))
+        mean = (importance_score * unmasked).sum(dim=(1, 2), keepdim=True) / rest.clamp(min=1)[:, None, None]
+        var = (((importance_score - mean) * unmasked) ** 2).sum(dim=(1, 2)) / (rest - 1).clamp(min=1)
+        has_activeness = has_guide & (rest > 1)
+        activeness = torch.sqrt(torch.where(has_activeness, var, torch.ones_like(var)))
+        activeness = torch.where(has_activeness, activeness, torch.zeros_like(activeness))
+
+        guide_loss_final = self.zero_loss_like(mel) + guide_loss.sum() / bs
+        activeness_final = self.zero_loss_like(mel) + activeness.sum() / bs
 
         return guide_loss_final, activeness_final
\ No newline at end of file
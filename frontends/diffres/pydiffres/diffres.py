@@ -8,6 +8,7 @@ from frontends.diffres.pydiffres.core import Base
 from frontends.diffres.pydiffres.dilated_convolutions_1d.conv import DilatedConv, DilatedConv_Out_128
 
 from frontends.diffres.pydiffres.pooling import Pooling_layer
+from frontends.precision import fp32_forward
 
 EPS = 1e-12
 RESCALE_INTERVEL_MIN = 1e-4
@@ -28,6 +29,9 @@ class DiffRes(Base):
             stride=1,
         )
 
+    # exp/log of the features and the cumsum-based warping (whose frame boundaries
+    # move with small score changes) stay in float32 under autocast
+    @fp32_forward
     def forward(self, x):
         ret = {}
         score = torch.sigmoid(self.model(x.permute(0, 2, 1)).permute(0, 2, 1))
@@ -58,6 +62,20 @@ class DiffRes(Base):
         return ret
 
     def frame_warping(self, feature, score, total_length):
+        # Banded weights: every input frame feeds at most two output frames
+        index, weight = self.calculate_banded_weight(score, total_length=total_length)
+
+        mean_feature = self.banded_matmul(index, weight, feature, total_length)
+        odd_score, even_score = self.banded_odd_even_scores(index, weight, total_length)
+        max_pool_feature = self.scatter_maxpool_odd_even_scores(
+            odd_score, even_score, feature, out_len=self.output_seq_length
+        )
+        mean_pos_enc = self.banded_matmul(index, weight, self.pos_emb, total_length)
+
+        return mean_feature, max_pool_feature, mean_pos_enc
+
+    def frame_warping_dense(self, feature, score, total_length):
+        # Reference implementation with the dense (bs, in_seq_len, out_seq_len) weight
         weight = self.calculate_weight(score, feature, total_length=total_length)
 
         mean_feature = torch.matmul(weight.permute(0, 2, 1), feature)
@@ -0,0 +1,250 @@
+import pytest
+import torch
+from torch.testing import assert_close
+
+from frontends.diffres.pydiffres.core import RESCALE_INTERVEL_MIN, RESCALE_INTERVEL_MAX
+from frontends.diffres.pydiffres.diffres import DiffRes
+
+
+# Reference implementations: the per-example loops DiffRes used before vectorization
+
+def score_norm_loop(score, total_length):
+    sum_score = torch.sum(score, dim=(1, 2), keepdim=True)
+    score = (score / sum_score) * total_length
+
+    max_val = torch.max(score, dim=1)[0]
+    max_val = max_val[..., 0]
+    dims_need_norm = max_val >= 1
+    if torch.sum(dims_need_norm) > 0:
+        score[dims_need_norm] = (
+            score[dims_need_norm] / max_val[dims_need_norm][..., None, None]
+        )
+
+    if torch.sum(dims_need_norm) > 0:
+        sum_score = torch.sum(score, dim=(1, 2), keepdim=True)
+        distance_with_target_length = (total_length - sum_score)[:, 0, 0]
+        axis = torch.logical_and(
+            score < RESCALE_INTERVEL_MAX, score > RESCALE_INTERVEL_MIN
+        )
+        for i in range(score.size(0)):
+            if distance_with_target_length[i] >= 1:
+                intervel = 1.0 - score[i][axis[i]]
+                alpha = distance_with_target_length[i] / torch.sum(intervel)
+                if alpha > 1:
+                    alpha = 1
+                score[i][axis[i]] += intervel * alpha
+    return score, total_length
+
+
+def update_weight_loop(weight):
+    weight = weight.permute(0, 2, 1)
+    bs, gamma, m = weight.size()
+    for b in range(bs):
+        i, j, s = 0, 0, 0
+        while i < gamma - 1 and j < m - 1:
+            if weight[b, i, j] > 0:
+                s += weight[b, i, j]
+                j += 1
+                continue
+            else:
+                weight[b, i, j] = 1 - s
+                weight[b, i + 1, j] -= weight[b, i, j]
+                i += 1
+                s = 0
+    return weight.permute(0, 2, 1)
+
+
+def guide_loss_loop(model, mel, importance_score):
+    if torch.min(mel) < 0:
+        x = mel.exp()
+    else:
+        x = mel
+    score_mask = torch.mean(x, dim=-1, keepdim=True)
+    score_mask = score_mask < (torch.min(score_mask) + 1e-6)
+
+    guide_loss_final = model.zero_loss_like(mel)
+    activeness_final = model.zero_loss_like(mel)
+
+    for id in range(importance_score.size(0)):
+        guide_loss = torch.mean(importance_score[id][score_mask[id]])
+        if torch.isnan(guide_loss).item():
+            continue
+
+        if guide_loss > (1-model.dimension_reduction_rate) * 0.5:
+            guide_loss_final = (
+                guide_loss_final + guide_loss / importance_score.size(0)
+            )
+
+        # torch.std of fewer than two frames is nan (and warns): skipped as nan
+        rest = importance_score[id][~score_mask[id]]
+        if rest.numel() < 2:
+            continue
+        activeness = torch.std(rest)
+
+        activeness_final = (
+            activeness_final + activeness / importance_score.size(0)
+        )
+
+    return guide_loss_final, activeness_final
+
+
+def masked_weight(score, total_length):
+    # Monotonic expansion of calculate_weight, before the rows are made to sum to one
+    cumsum = torch.cumsum(score, dim=1).expand(-1, -1, total_length)
+    threshold = torch.arange(total_length, dtype=score.dtype)
+    mask = torch.logical_and(cumsum <= threshold + 1, cumsum > threshold)
+    return score.expand(-1, -1, total_length) * mask
+
+
+IN_F_DIM = 64
+SEEDS = [0, 1]
+BATCH_SIZES = [1, 5, 16]
+LENGTHS = [101, 251]
+# Mild scores never reach 1 after normalisation, peaky ones trigger the rescaling branch
+SCORES = {'mild': (0.5, 0.0), 'peaky': (6.0, -6.0)}
+
+# The loops are compared in float64: in float32 their sequential sums and the
+# vectorized cumsums round differently (gradients differ by ~1e-5 of their magnitude)
+VALUE_TOL = dict(rtol=1e-10, atol=1e-10)
+GRAD_TOL = dict(rtol=1e-8, atol=1e-8)
+# calculate_weight builds its masks in float32, so warping and pooling run in float32
+FLOAT32_VALUE_TOL = dict(rtol=1e-5, atol=1e-5)
+FLOAT32_GRAD_TOL = dict(rtol=1e-4, atol=5e-4)
+
+cases = pytest.mark.parametrize('seed', SEEDS)
+batches = pytest.mark.parametrize('batch_size', BATCH_SIZES)
+lengths = pytest.mark.parametrize('in_t_dim', LENGTHS)
+scores = pytest.mark.parametrize('scores', list(SCORES))
+
+
+@pytest.fixture
+def float64():
+    dtype = torch.get_default_dtype()
+    torch.set_default_dtype(torch.float64)
+    yield
+    torch.set_default_dtype(dtype)
+
+
+def make_model(in_t_dim):
+    return DiffRes(in_t_dim=in_t_dim, in_f_dim=IN_F_DIM, dimension_reduction_rate=0.60)
+
+
+def make_logits(seed, batch_size, in_t_dim, scores):
+    spread, offset = SCORES[scores]
+    torch.manual_seed(seed)
+    return (torch.randn(batch_size, in_t_dim, 1) * spread + offset).requires_grad_()
+
+
+@cases
+@batches
+@lengths
+@scores
+@pytest.mark.usefixtures('float64')
+def test_score_norm(seed, batch_size, in_t_dim, scores):
+    model = make_model(in_t_dim)
+    total_length = model.output_seq_length
+    logits = make_logits(seed, batch_size, in_t_dim, scores)
+
+    reference, _ = score_norm_loop(torch.sigmoid(logits), total_length)
+    vectorized, _ = model.score_norm(torch.sigmoid(logits), total_length)
+    assert_close(vectorized, reference, **VALUE_TOL)
+
+    grad_reference, = torch.autograd.grad(reference.pow(2).sum(), logits)
+    grad_vectorized, = torch.autograd.grad(vectorized.pow(2).sum(), logits)
+    assert_close(grad_vectorized, grad_reference, **GRAD_TOL)
+
+
+@cases
+@batches
+@lengths
+@scores
+@pytest.mark.usefixtures('float64')
+def test_update_weight(seed, batch_size, in_t_dim, scores):
+    model = make_model(in_t_dim)
+    total_length = model.output_seq_length
+    logits = make_logits(seed, batch_size, in_t_dim, scores)
+    score = model.score_norm(torch.sigmoid(logits), total_length)[0].detach().requires_grad_()
+
+    reference = update_weight_loop(masked_weight(score, total_length))
+    vectorized = model.update_weight(masked_weight(score, total_length))
+    assert_close(vectorized, reference, **VALUE_TOL)
+
+    grad_reference, = torch.autograd.grad(reference.pow(2).sum(), score)
+    grad_vectorized, = torch.autograd.grad(vectorized.pow(2).sum(), score)
+    assert_close(grad_vectorized, grad_reference, **GRAD_TOL)
+
+
+@cases
+@batches
+@lengths
+@scores
+def test_frame_warping_banded(seed, batch_size, in_t_dim, scores):
+    """Banded frame warping against the dense weight matrix."""
+    model = make_model(in_t_dim)
+    total_length = model.output_seq_length
+    logits = make_logits(seed, batch_size, in_t_dim, scores)
+    feature = torch.rand(batch_size, in_t_dim, IN_F_DIM).requires_grad_()
+    score, _ = model.score_norm(torch.sigmoid(logits), total_length)
+
+    dense = model.frame_warping_dense(feature, score, total_length)
+    banded = model.frame_warping(feature, score, total_length)
+    for b, d in zip(banded, dense):
+        assert_close(b, d, **FLOAT32_VALUE_TOL)
+
+    grad_dense = torch.autograd.grad(sum(out.pow(2).sum() for out in dense), (logits, feature),
+                                     retain_graph=True)
+    grad_banded = torch.autograd.grad(sum(out.pow(2).sum() for out in banded), (logits, feature))
+    for b, d in zip(grad_banded, grad_dense):
+        assert_close(b, d, **FLOAT32_GRAD_TOL)
+
+
+@cases
+@batches
+@lengths
+@scores
+@pytest.mark.parametrize('reduce', ['max', 'avg'])
+def test_odd_even_pooling(seed, batch_size, in_t_dim, scores, reduce):
+    """Single-pass odd/even scatter pooling against two passes interleaved."""
+    model = make_model(in_t_dim)
+    total_length = model.output_seq_length
+    logits = make_logits(seed, batch_size, in_t_dim, scores)
+    feature = torch.rand(batch_size, in_t_dim, IN_F_DIM)
+    with torch.no_grad():
+        score, _ = model.score_norm(torch.sigmoid(logits), total_length)
+        weight = model.calculate_weight(score, feature, total_length)
+        odd_score, odd_index = model.select_odd_dimensions(weight)
+        even_score, even_index = model.select_even_dimensions(weight)
+
+        if reduce == 'max':
+            pool = model.calculate_scatter_maxpool
+            single = model.calculate_scatter_maxpool_odd_even_lines(weight, feature, total_length)
+        else:
+            pool = model.calculate_scatter_avgpool
+            single = model.calculate_scatter_avgpool_odd_even_lines(weight, feature, total_length)
+        reference = torch.zeros(batch_size, total_length, IN_F_DIM)
+        reference[:, odd_index] = pool(odd_score, feature, out_len=int(odd_index.sum()))
+        reference[:, even_index] = pool(even_score, feature, out_len=int(even_index.sum()))
+    assert_close(single, reference, **FLOAT32_VALUE_TOL)
+
+
+@cases
+@batches
+@lengths
+@pytest.mark.usefixtures('float64')
+def test_guide_loss(seed, batch_size, in_t_dim):
+    """Batched guide loss against the per-example loop, with silent frames in some examples."""
+    model = make_model(in_t_dim)
+    torch.manual_seed(seed)
+    mel = torch.randn(batch_size, in_t_dim, IN_F_DIM)
+    mel[:(batch_size + 1) // 2, :20] = -30.0
+    mel[batch_size // 2:batch_size // 2 + 1] = -30.0
+    importance_score = torch.rand(batch_size, in_t_dim, 1).requires_grad_()
+
+    reference = guide_loss_loop(model, mel, importance_score)
+    vectorized = model.guide_loss(mel, importance_score)
+    for v, r in zip(vectorized, reference):
+        assert_close(v, r, **VALUE_TOL)
+
+    grad_reference = torch.autograd.grad(sum(reference), importance_score)[0]
+    grad_vectorized = torch.autograd.grad(sum(vectorized), importance_score)[0]
+    assert_close(grad_vectorized, grad_reference, **GRAD_TOL)
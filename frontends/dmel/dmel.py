@@ -23,4 +23,39 @@ def differentiable_spectrogram(x, lambd, n_fft, win_length, hop_length, norm=Fal
         pad_mode='constant'
     )
     s = torch.pow(torch.abs(s), 2)
-    return s
\ No newline at end of file
+    return s
+
+
+def differentiable_gaussian_windows(lambd, window_length, norm=True):
+    # One window per entry of lambd: (batch_size,) -> (batch_size, window_length)
+    m = torch.arange(0, window_length, dtype=torch.float, device=lambd.device)
+    window = torch.exp(-0.5 * ((m - window_length / 2) / (lambd[:, None] + 1e-15)) ** 2)
+    window_norm = window / torch.sqrt(torch.sum(window ** 2, dim=-1, keepdim=True))
+    if norm:
+        return window_norm
+    else:
+        return window
+
+def batched_differentiable_spectrogram(x, lambd, n_fft, win_length, hop_length, norm=False):
+    """
+    Power spectrogram of a (batch_size, signal_length) batch in one STFT.
+
+    A scalar lambd builds one window and runs one batched torch.stft. A
+    (batch_size,) lambd gives every example its own window: frames are
+    windowed per example and transformed in a single batched FFT. Both
+    match differentiable_spectrogram applied clip by clip.
+
+    Returns:
+        (batch_size, n_fft // 2 + 1, time_steps)
+    """
+    if lambd.dim() == 0:
+        return differentiable_spectrogram(x, lambd, n_fft, win_length, hop_length, norm=norm)
+
+    windows = differentiable_gaussian_windows(lambd, window_length=win_length, norm=norm)
+    # Center the windows in n_fft and pad the signal, as torch.stft(center=True, pad_mode='constant')
+    left = (n_fft - win_length) // 2
+    windows = F.pad(windows, (left, n_fft - win_length - left))
+    frames = F.pad(x, (n_fft // 2, n_fft // 2)).unfold(-1, n_fft, hop_length)  # (batch, time_steps, n_fft)
+    s = torch.fft.rfft(frames * windows[:, None, :])
+    s = torch.pow(torch.abs(s), 2)
+    return s.transpose(1, 2)
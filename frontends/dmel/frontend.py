@@ -1,7 +1,9 @@
+import time
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from frontends.dmel.dmel import differentiable_spectrogram
+from frontends.dmel.dmel import differentiable_spectrogram, batched_differentiable_spectrogram
 
 
 class DMel(nn.Module):
@@ -13,8 +15,28 @@ class DMel(nn.Module):
         self.hop_length = hop_length
         self.norm = norm
 
-    def forward(self, x):
-        # x is expected to be of shape (batch_size, signal_length)
+    def forward(self, x, lambd=None):
+        """
+        x: (batch_size, signal_length)
+        lambd: optional window width overriding self.lambd, either a scalar or a
+            (batch_size,) tensor giving every example its own Gaussian window
+            (e.g. gathered from learned per-class widths)
+
+        Returns:
+            (batch_size, n_fft // 2 + 1, time_steps) power spectrograms
+        """
+        x = x - x.mean(dim=1, keepdim=True)
+        lambd = self.lambd if lambd is None else lambd
+        return batched_differentiable_spectrogram(
+            x, lambd,
+            n_fft=self.n_fft,
+            win_length=self.win_length,
+            hop_length=self.hop_length,
+            norm=self.norm
+        )
+
+    def forward_per_clip(self, x):
+        # Reference implementation: one window and one STFT per clip
         x = x - x.mean(dim=1, keepdim=True)
         batch_size = x.shape[0]
         spectrograms = []
@@ -50,11 +72,26 @@ def main():
     signal_length = 256000
     x = torch.randn(batch_size, signal_length).to(device)
 
-    # Compute the spectrograms
-    spectrograms = spectrogram_module(x)
+    # Compute the spectrograms, batched and clip by clip
+    with torch.no_grad():
+        for name, fn in [('per clip', spectrogram_module.forward_per_clip), ('batched', spectrogram_module)]:
+            fn(x)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            spectrograms = fn(x)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            print(f"{name:>8}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+        reference = spectrogram_module.forward_per_clip(x)
+        print(f"Max relative difference: {((spectrograms - reference).abs().max() / reference.abs().max()).item():.2e}")
+
+        # Per-example window widths, one batched FFT
+        lambd = torch.linspace(2.0, 8.0, batch_size, device=device)
+        per_example = spectrogram_module(x, lambd=lambd)
 
     # Print the shape of the spectrograms
-    print(f"Spectrograms shape: {spectrograms.shape}")
+    print(f"Spectrograms shape: {spectrograms.shape}, per-example lambda: {per_example.shape}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
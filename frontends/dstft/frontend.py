@@ -11,6 +11,8 @@ import matplotlib.pyplot as plt
 import torch
 from torch import nn
 
+from frontends.precision import fp32_forward
+
 
 class DSTFT(nn.Module):
     """Differentiable short-time Fourier transform (DSTFT) module.
@@ -23,7 +25,7 @@ class DSTFT(nn.Module):
 
     def __init__(
         self: DSTFT,
-        x: torch.tensor,
+        x: torch.tensor | None,
         win_length: float,
         support: int,
         stride: int,
@@ -48,16 +50,26 @@ class DSTFT(nn.Module):
         stride_transform=None,
         dynamic_parameter: bool = False,
         first_frame: bool = False,
+        length: int | None = None,
+        device: torch.device | str | None = None,
+        dtype: torch.dtype = torch.float32,
+        keep_intermediates: bool = True,
     ):
         super().__init__()
 
+        # An example input x only provides the signal length, device and dtype;
+        # batch size and length are derived from the input on every call.
+        if x is not None:
+            length, device, dtype = x.shape[-1], x.device, x.dtype
+        elif length is None:
+            raise ValueError("DSTFT needs an example input x or the signal length")
+
         # Constants and hyperparameters
         self.N = support  # support size
         self.F = int(1 + self.N / 2)  # nb of frequencies
-        self.B = x.shape[0]  # batch size
-        self.L = x.shape[-1]  # signal length
-        self.device = x.device
-        self.dtype = x.dtype
+        self.L = length  # signal length (of the last input)
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.dtype = dtype
 
         self.win_requires_grad = win_requires_grad
         self.stride_requires_grad = stride_requires_grad
@@ -67,6 +79,9 @@ class DSTFT(nn.Module):
         self.first_frame = first_frame
         self.sr = sr
         self.pow = pow
+        # Keep tap_win / folded_x / tapered_x on the module after each stft
+        # (needed by inverse_dstft and plot); disable to free them after the call.
+        self.keep_intermediates = keep_intermediates
         self.tap_win = None
 
         # Register eps and min as a buffer tensor
@@ -94,7 +109,13 @@ class DSTFT(nn.Module):
         #        x.shape[-1] - (self.N - 1) - 1, stride, rounding_mode="floor",
         #    ),
         # )
-        self.T = 1 + int(torch.div(x.shape[-1], stride, rounding_mode="floor"))
+        self.T = 1 + int(length // abs(stride))  # nb of frames (of the last input)
+        # Per-frame parameters (win_p / stride_p / pow_p = "t") are sized for this many frames
+        self.max_T = self.T
+        self.per_frame = "t" in (win_p, stride_p, pow_p)
+        self._index_cache = {}
+        self._frame_plan = None
+        self._fold_plan = None
 
         if win_min is None:
             self.win_min = self.N / 20
@@ -237,19 +258,119 @@ class DSTFT(nn.Module):
         )
         return p_out
 
+    def set_length(self: DSTFT, length: int) -> None:
+        """Adapt the frame count to a signal of the given length."""
+        if length == self.L:
+            return
+        T = 1 + int(length // self.init_stride)
+        if self.per_frame and T > self.max_T:
+            raise ValueError(
+                f"Per-frame parameters are sized for {self.max_T} frames, "
+                f"a signal of {length} samples needs {T}",
+            )
+        self.L = length
+        self.T = T
+
+    def indices(self: DSTFT, device: torch.device) -> dict:
+        """Frame index tensors for the current signal length, cached per (length, device).
+
+        Under torch.compile they are built inline: filling the cache while
+        tracing would make the graph guard on it and recompile on the next call.
+        """
+        compiling = torch.compiler.is_compiling()
+        key = (self.L, device)
+        if compiling or key not in self._index_cache:
+            indices = {
+                # sample offsets within a frame
+                "offsets": torch.arange(0, self.N, device=device),
+                # base of the tapering window, N x T
+                "base": torch.arange(
+                    0, self.N, 1, dtype=self.dtype, device=device,
+                )[:, None].expand([-1, self.T]),
+                # frequency bins for the fractional shift
+                "freqs": torch.arange(
+                    end=self.F, device=device, dtype=self.dtype,
+                ),
+            }
+            if compiling:
+                return indices
+            self._index_cache[key] = indices
+        return self._index_cache[key]
+
+    def frame_plan(self: DSTFT, device: torch.device) -> tuple:
+        """Integer framing of the signal, recomputed only when the strides change.
+
+        Returns ("strided", first_frame, step) when frames are evenly spaced by an
+        integer step, so they can be taken as a view of the signal, and
+        ("gather", idx_floor, outside) otherwise. Under torch.compile the gather
+        plan is always traced, so the graph never depends on a host-side check.
+        """
+        if torch.compiler.is_compiling():
+            with torch.no_grad():
+                return self.gather_plan(self.frames.floor().long(), device)
+
+        key = (self.L, device, self.strides.data_ptr(), self.strides._version)
+        if self._frame_plan is not None and self._frame_plan[0] == key:
+            return self._frame_plan[1]
+
+        with torch.no_grad():
+            starts = self.frames.floor().long()
+            steps = starts.diff()
+            first, step, even = torch.stack((
+                starts[0],
+                steps[0] if self.T > 1 else torch.ones_like(starts[0]),
+                (steps == steps[:1]).all() if self.T > 1 else torch.ones_like(starts[0]),
+            )).tolist()
+
+            if even and step > 0:
+                plan = ("strided", first, step)
+            else:
+                plan = self.gather_plan(starts, device)
+
+        self._frame_plan = (key, plan)
+        return plan
+
+    def gather_plan(self: DSTFT, starts: torch.tensor, device: torch.device) -> tuple:
+        """("gather", idx_floor, outside) framing plan for integer frame starts."""
+        idx_floor = starts[:, None].expand((
+            self.T,
+            self.N,
+        )) + self.indices(device)["offsets"]
+        outside = (idx_floor < 0) | (idx_floor >= self.L)
+        return ("gather", idx_floor.clamp(0, self.L - 1), outside)
+
+    def fold_indices(self: DSTFT, device: torch.device) -> torch.tensor:
+        """Signal index of every frame sample (T * N), recomputed only when the strides change.
+
+        Samples falling outside the signal point to index L, a scratch slot
+        dropped after the overlap-add.
+        """
+        compiling = torch.compiler.is_compiling()
+        key = (self.L, device, self.strides.data_ptr(), self.strides._version) if not compiling else None
+        if not compiling and self._fold_plan is not None and self._fold_plan[0] == key:
+            return self._fold_plan[1]
+
+        with torch.no_grad():
+            idx = self.frames.trunc().long()[:, None] + self.indices(device)["offsets"]
+            idx = idx.masked_fill((idx < 0) | (idx >= self.L), self.L).flatten()
+
+        if not compiling:
+            self._fold_plan = (key, idx)
+        return idx
+
     @property
     def actual_win_length(self: DSTFT):  # contraints
-        return self.window_transform(self.win_length)
+        return self.window_transform(self.win_length[..., : self.T])
 
     @property
     def actual_strides(
         self,
     ):  # stride contraints, actual stride between frames
-        return self.stride_transform(self.strides)
+        return self.stride_transform(self.strides[: self.T])
 
     @property
     def actual_pow(self: DSTFT):  # pow contraints
-        return self.pow_transform(self.win_pow)
+        return self.pow_transform(self.win_pow[..., : self.T])
 
     @property
     def frames(self: DSTFT):
@@ -292,6 +413,7 @@ class DSTFT(nn.Module):
         effective_strides = effective_strides - cat
         return effective_strides
 
+    @fp32_forward
     def forward(self: DSTFT, x: torch.tensor) -> tuple:
         # Perform the forward STFT and extract the magnitude, phase, real, and imaginary parts
         stft = self.stft(x, "forward")
@@ -308,29 +430,28 @@ class DSTFT(nn.Module):
         return dl_dp
 
     def stft(self: DSTFT, x: torch.tensor, direction: str):
-        # batch_size, length, device, dtype = x.shape[0], x.shape[-1], x.device, x.dtype
+        # Frame count follows the input length, batch size is never stored
+        self.set_length(x.shape[-1])
 
         # Generate strided signal and shift idx_frac
         folded_x, idx_frac = self.unfold(x)  # B, T, N; T
 
         # Generate the tapering window function for the STFT
-        self.tap_win = self.window_function(
+        tap_win = self.window_function(
             direction=direction, idx_frac=idx_frac,
         ).permute(1, 0)  # T, N
 
         # Compute tapered x
-        self.folded_x = folded_x[:, :, :]  # B, T, N
-        self.tap_win = self.tap_win[None, :, :]  # 1, T, 1
-        self.tapered_x = self.folded_x * self.tap_win  # B, T, N,
+        tap_win = tap_win[None, :, :]  # 1, T, 1
+        tapered_x = folded_x * tap_win  # B, T, N,
+        if self.keep_intermediates:
+            self.folded_x = folded_x
+            self.tap_win = tap_win
+            self.tapered_x = tapered_x
 
-        spectr = torch.fft.rfft(self.tapered_x)
+        spectr = torch.fft.rfft(tapered_x)
 
-        shift = torch.arange(
-            end=self.F,
-            device=self.device,
-            dtype=self.dtype,
-            requires_grad=False,
-        )
+        shift = self.indices(x.device)["freqs"]
         shift = idx_frac[:, None] * shift[None, :]  # T, N
         shift = torch.exp(2j * pi * shift / self.N)[None, ...]  # 1, T, N
 
@@ -376,33 +497,34 @@ class DSTFT(nn.Module):
         return x_hat
 
     def unfold(self: DSTFT, x: torch.tensor) -> torch.tensor:
-        # frames index and strided x
-        idx_floor = self.frames.floor()
-        # print(self.frames.shape, self.frames)
-        idx_frac = self.frames - idx_floor
-        idx_floor = idx_floor.long()[:, None].expand((
-            self.T,
-            self.N,
-        )) + torch.arange(0, self.N, device=self.device)
-        idx_floor[idx_floor >= self.L] = -1
-        # print(self.B, idx_floor.shape, x.shape)
-        folded_x = x[:, idx_floor]
-        folded_x[:, idx_floor < 0] = 0
+        # fractional part of the frame positions, differentiable w.r.t. strides
+        frames = self.frames
+        idx_frac = frames - frames.floor()
+
+        # strided x, samples outside the signal are zero
+        plan = self.frame_plan(x.device)
+        if plan[0] == "strided":
+            _, first, step = plan
+            last = first + step * (self.T - 1) + self.N
+            pad_left, pad_right = max(0, -first), max(0, last - self.L)
+            if pad_left or pad_right:
+                x = nn.functional.pad(x, (pad_left, pad_right))
+            folded_x = x[:, first + pad_left : last + pad_left].unfold(
+                -1, self.N, step,
+            )  # B, T, N view
+        else:
+            _, idx_floor, outside = plan
+            folded_x = x[:, idx_floor].masked_fill(outside, 0)
         return folded_x, idx_frac
 
     def fold(self: DSTFT, folded_x: torch.tensor) -> torch.tensor:
+        # overlap-add of the B, T, N frames in a single scatter
+        idx = self.fold_indices(folded_x.device)
         x_hat = torch.zeros(
-            self.B, self.L, device=self.device, dtype=self.dtype,
+            folded_x.shape[0], self.L + 1, device=folded_x.device, dtype=folded_x.dtype,
         )
-        # print(x_hat.shape, self.B, self.L)
-        #print(folded_x.shape)
-        for t in range(self.T):
-            start_idx = max(0, int(self.frames[t]))
-            end_idx = min(self.L - 1, int(self.frames[t]) + self.N)
-            start_dec = start_idx - int(self.frames[t])
-            end_dec = end_idx - int(self.frames[t])
-            x_hat[:, start_idx:end_idx] += folded_x[:, t, start_dec:end_dec]
-        return x_hat
+        x_hat = x_hat.index_add(1, idx, folded_x.reshape(folded_x.shape[0], -1))
+        return x_hat[:, : self.L]
 
     def window_function(self: DSTFT, direction: str, idx_frac) -> torch.tensor:
         if self.tapering_function not in {"hann", "hanning"}:
@@ -411,9 +533,7 @@ class DSTFT(nn.Module):
             )
         else:
             # Create an array of indices to use as the base for the window function
-            base = torch.arange(
-                0, self.N, 1, dtype=self.dtype, device=self.device,
-            )[:, None].expand([-1, self.T])
+            base = self.indices(idx_frac.device)["base"]
             base = base - idx_frac
             # Expand the win_length parameter to match the shape of the base array
 
@@ -425,18 +545,18 @@ class DSTFT(nn.Module):
             or self.tapering_function == "hanning"
         ):
             if direction == "forward":
-                self.tap_win = 0.5 - 0.5 * torch.cos(
+                tap_win = 0.5 - 0.5 * torch.cos(
                     2
                     * pi
                     * (base + (self.actual_win_length - self.N + 1) / 2)
                     / self.actual_win_length,
                 )
-                self.tap_win[mask1] = 0
-                self.tap_win[mask2] = 0
-                # self.tap_win = self.tap_win / self.tap_win.sum(
+                tap_win[mask1] = 0
+                tap_win[mask2] = 0
+                # tap_win = tap_win / tap_win.sum(
                 #    dim=0, keepdim=True,
                 # )
-                return self.tap_win.pow(self.win_pow)
+                return tap_win.pow(self.win_pow[..., : self.T])
 
             elif direction == "backward":
                 f = torch.sin(
@@ -458,37 +578,18 @@ class DSTFT(nn.Module):
         return None
 
     def synt_win(self: DSTFT, direction: str, idx_frac) -> torch.tensor:
-        
-        wins = torch.zeros(self.L)        
-        for t in range(self.T):
-            start_idx = max(0, int(self.frames[t]))
-            end_idx = min(self.L, int(self.frames[t]) + self.N)
-            start_dec = start_idx - int(self.frames[t])
-            end_dec = end_idx - int(self.frames[t])
-            wins[start_idx:end_idx] += (
-                self.tap_win[:, t, start_dec:end_dec].squeeze().detach().cpu()
-            )
+        if self.tap_win is None:
+            raise RuntimeError("inverse_dstft needs the window of the last stft, use keep_intermediates=True")
+
+        # overlap-added analysis windows and their inverse, slot L is the scratch slot
+        idx = self.fold_indices(self.tap_win.device)
+        wins = self.fold(self.tap_win.detach())[0]
         self.wins = wins
-        self.iwins = torch.zeros(self.L)
-        self.iwins[ self.wins > 0 ] = 1 / self.wins[self.wins > 0]
-        
-        plt.plot(self.wins, label="wins")
-        plt.plot(self.iwins, label='iwins')
-        plt.plot(self.iwins * self.wins)
-        plt.legend()
-        
-        itap_win = torch.zeros_like(self.tap_win)
-        for t in range(self.T):
-            start_idx = max(0, int(self.frames[t]))
-            end_idx = min(self.L, int(self.frames[t]) + self.N)
-            start_dec = start_idx - int(self.frames[t])
-            end_dec = end_idx - int(self.frames[t])
-            itap_win[:, t, start_dec:end_dec] = (
-            #self.tap_win[:, t, start_dec:end_dec]
-            #/ wins[start_idx:end_idx] * 
-            self.iwins[start_idx:end_idx]
-        )
-        return itap_win
+        self.iwins = torch.where(wins > 0, 1 / wins, torch.zeros_like(wins))
+
+        # inverse window seen by every frame sample, zero outside the signal
+        itap_win = nn.functional.pad(self.iwins, (0, 1))[idx]
+        return itap_win.view(self.tap_win.shape)
 
     def coverage(self: DSTFT):  # in [0, 1]
         # compute coverage
@@ -638,7 +739,6 @@ class ADSTFT(nn.Module):
         # Constants and hyperparameters
         self.N = support  # support size
         self.F = int(1 + self.N / 2)  # nb of frequencies
-        self.B = x.shape[0]  # batch size
         self.L = x.shape[-1]  # signal length
         self.device = x.device
         self.dtype = x.dtype
@@ -1165,7 +1265,6 @@ class FDSTFT(nn.Module):
         # Constants and hyperparameters
         self.N = support  # support size
         self.F = int(1 + self.N / 2)  # nb of frequencies
-        self.B = x.shape[0]  # batch size
         self.L = x.shape[-1]  # signal length
         self.device = x.device
         self.dtype = x.dtype
@@ -1437,18 +1536,17 @@ class FDSTFT(nn.Module):
         return folded_x, idx_frac
 
     def fold(self: DSTFT, folded_x: torch.tensor) -> torch.tensor:
+        # overlap-add of the B, T, N frames in a single scatter, slot L is a scratch slot
+        with torch.no_grad():
+            idx = self.frames.trunc().long()[:, None] + torch.arange(
+                0, self.N, device=folded_x.device,
+            )
+            idx = idx.masked_fill((idx < 0) | (idx >= self.L), self.L).flatten()
         x_hat = torch.zeros(
-            self.B, self.L, device=self.device, dtype=self.dtype,
+            folded_x.shape[0], self.L + 1, device=folded_x.device, dtype=folded_x.dtype,
         )
-        # print(x_hat.shape, self.B, self.L)
-        #print(folded_x.shape)
-        for t in range(self.T):
-            start_idx = max(0, int(self.frames[t]))
-            end_idx = min(self.L - 1, int(self.frames[t]) + self.N)
-            start_dec = start_idx - int(self.frames[t])
-            end_dec = end_idx - int(self.frames[t])
-            x_hat[:, start_idx:end_idx] += folded_x[:, t, start_dec:end_dec]
-        return x_hat
+        x_hat = x_hat.index_add(1, idx, folded_x.reshape(folded_x.shape[0], -1))
+        return x_hat[:, : self.L]
 
     def window_function(self: DSTFT, direction: str, idx_frac) -> torch.tensor:
         if self.tapering_function not in {"hann", "hanning"}:
@@ -0,0 +1,138 @@
+import time
+
+import numpy as np
+import librosa
+import torch
+import torch.nn as nn
+import torchaudio
+from torchlibrosa.stft import Spectrogram, LogmelFilterBank
+
+from frontends.chroma.frontend import Chroma
+from frontends.precision import fp32_forward
+
+
+class EnsembleFeatures(nn.Module):
+    def __init__(self, sample_rate, n_fft, hop_length, n_mels, fmin, fmax, n_mfcc=None, n_chroma=None,
+                 ref=1.0, amin=1e-10, top_db=None, center=True, pad_mode='reflect'):
+        """
+        MFCC, chroma and log-mel features of the 'ensemble' frontend from one STFT.
+
+        A single Hann-windowed power spectrogram per batch feeds:
+        - log-mel: librosa mel filterbank and power_to_db, as torchlibrosa's
+          Spectrogram + LogmelFilterBank
+        - MFCC: orthonormal DCT-II of that same log-mel
+        - chroma: the Chroma filterbank and per-frame normalization, applied
+          to the shared spectrogram (so its edge frames use pad_mode instead
+          of librosa's zero padding)
+        """
+        super(EnsembleFeatures, self).__init__()
+        n_mfcc = n_mels if n_mfcc is None else n_mfcc
+        n_chroma = n_mels if n_chroma is None else n_chroma
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.center = center
+        self.pad_mode = pad_mode
+        self.ref = ref
+        self.amin = amin
+        self.top_db = top_db
+
+        window = librosa.filters.get_window('hann', n_fft, fftbins=True)
+        melW = librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax).T
+        self.register_buffer('window', torch.tensor(window, dtype=torch.float), persistent=False)
+        self.register_buffer('melW', torch.tensor(melW, dtype=torch.float), persistent=False)
+        # (n_mels, n_mfcc)
+        self.register_buffer('dct', torchaudio.functional.create_dct(n_mfcc, n_mels, 'ortho'), persistent=False)
+        self.chroma = Chroma(sample_rate, n_fft, hop_length, n_chroma=n_chroma, tuning=0.0)
+
+    def power_spectrogram(self, x):
+        """
+        x: (batch_size, data_length)
+
+        Returns:
+            (batch_size, n_fft // 2 + 1, time_steps)
+        """
+        s = torch.stft(
+            x,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            window=self.window,
+            center=self.center,
+            pad_mode=self.pad_mode,
+            return_complex=True,
+        )
+        return s.real ** 2 + s.imag ** 2
+
+    def power_to_db(self, x):
+        # torchlibrosa's LogmelFilterBank.power_to_db
+        log_spec = 10.0 * torch.log10(torch.clamp(x, min=self.amin))
+        log_spec = log_spec - 10.0 * np.log10(np.maximum(self.amin, self.ref))
+        if self.top_db is not None:
+            log_spec = torch.maximum(log_spec, log_spec.amax() - self.top_db)
+        return log_spec
+
+    @fp32_forward
+    def forward(self, x):
+        """
+        x: (batch_size, data_length)
+
+        Returns:
+            mfcc: (batch_size, 1, time_steps, n_mfcc)
+            chroma: (batch_size, 1, time_steps, n_chroma)
+            logmel: (batch_size, 1, time_steps, n_mels)
+        """
+        power = self.power_spectrogram(x)
+        logmel = self.power_to_db(torch.matmul(power.transpose(1, 2), self.melW))
+        mfcc = torch.matmul(logmel, self.dct)
+        chroma = self.chroma.chroma_from_power(power).transpose(1, 2)
+        return mfcc.unsqueeze(1), chroma.unsqueeze(1), logmel.unsqueeze(1)
+
+
+def main():
+    sample_rate, n_fft, hop_length, n_mels, fmin, fmax = 128000, 2048, 1024, 64, 50, 64000
+    batch_size, signal_length = 32, 256000
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    torch.manual_seed(0)
+    x = torch.randn(batch_size, signal_length, device=device)
+
+    features = EnsembleFeatures(sample_rate, n_fft, hop_length, n_mels, fmin, fmax).to(device)
+
+    # The three separate transforms the 'ensemble' frontend used before
+    mfcc_extractor = torchaudio.transforms.MFCC(
+        sample_rate=sample_rate, n_mfcc=n_mels,
+        melkwargs={"n_fft": n_fft, "n_mels": n_mels, "hop_length": hop_length, "f_min": fmin,
+                   "f_max": fmax, "center": True, "pad_mode": 'reflect'}).to(device)
+    chroma_extractor = Chroma(sample_rate, n_fft, hop_length, n_chroma=n_mels).to(device)
+    spectrogram_extractor = Spectrogram(n_fft=n_fft, hop_length=hop_length, win_length=n_fft, window='hann',
+                                        center=True, pad_mode='reflect', freeze_parameters=True).to(device)
+    logmel_extractor = LogmelFilterBank(sr=sample_rate, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax,
+                                        ref=1.0, amin=1e-10, top_db=None, freeze_parameters=True).to(device)
+
+    def separate():
+        return (mfcc_extractor(x), chroma_extractor(x),
+                logmel_extractor(spectrogram_extractor(x)))
+
+    with torch.no_grad():
+        for name, fn in [('separate', separate), ('shared', lambda: features(x))]:
+            fn()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            out = fn()
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            print(f"{name:>8}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        mfcc, chroma, logmel = features(x)
+        _, chroma_ref, logmel_ref = separate()
+        print(f"shapes: mfcc {tuple(mfcc.shape)}, chroma {tuple(chroma.shape)}, logmel {tuple(logmel.shape)}")
+        print(f"logmel max abs difference to torchlibrosa: {(logmel - logmel_ref).abs().max().item():.2e} dB")
+        # Inner frames see the same samples with either padding
+        inner = (chroma - chroma_ref.transpose(1, 2).unsqueeze(1))[:, :, 1:-1]
+        print(f"chroma max abs difference to Chroma, inner frames: {inner.abs().max().item():.2e}")
+        mfcc_ref = torch.matmul(logmel_ref, features.dct)
+        print(f"mfcc max abs difference to DCT of torchlibrosa log-mel: {(mfcc - mfcc_ref).abs().max().item():.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# File: frontends/feature_cache.py
+
+import os
+import json
+
+import numpy as np
+import torch
+
+
+INDEX_NAME = 'index.json'
+
+
+def feature_key(sample_rate, window_size, hop_size, mel_bins, fmin, fmax, resampler='fft', stft_engine='fft'):
+    """Sub-directory name of a cache built for a given extractor and resampler."""
+    return (f'sr{sample_rate}_win{window_size}_hop{hop_size}_mel{mel_bins}_fmin{fmin}_fmax{fmax}'
+            f'_{resampler}_{stft_engine}')
+
+
+class LogmelCache:
+    """
+    Cache of deterministic log-mel features, keyed by clip name.
+
+    Features are stored as float16 (1, time_steps, mel_bins) tensors, in RAM
+    and optionally on disk as memory-mapped shards under
+    <cache_dir>/<feature_key>/. A cache only serves features computed with
+    the same (sample_rate, window_size, hop_size, mel_bins, fmin, fmax),
+    from waveforms loaded with the same resampler and extracted with the same
+    stft_engine.
+
+    Calling the cache with a model exposing ``extract_logmel`` returns the
+    features of a batch, running the extractor only for batches that are not
+    fully cached yet.
+    """
+
+    def __init__(self, sample_rate, window_size, hop_size, mel_bins, fmin, fmax, resampler='fft',
+                 stft_engine='fft', cache_dir=None):
+        self.key = feature_key(sample_rate, window_size, hop_size, mel_bins, fmin, fmax, resampler, stft_engine)
+        self.cache_dir = os.path.join(cache_dir, self.key) if cache_dir is not None else None
+        self.features = {}
+        self.pending = []
+        self.shards = []
+
+        if self.cache_dir is not None:
+            index_path = os.path.join(self.cache_dir, INDEX_NAME)
+            if os.path.exists(index_path):
+                with open(index_path, 'r') as f:
+                    index = json.load(f)
+                self.shards = index['shards']
+                for shard_name, names in zip(self.shards, index['names']):
+                    shard = np.load(os.path.join(self.cache_dir, shard_name), mmap_mode='r')
+                    for row, name in enumerate(names):
+                        self.features[name] = shard[row]
+
+    def __len__(self):
+        return len(self.features)
+
+    def get(self, audio_names):
+        """Stacked float16 features of a batch, or None unless every clip is cached."""
+        if not all(name in self.features for name in audio_names):
+            return None
+        return torch.from_numpy(np.stack([self.features[name] for name in audio_names]))
+
+    def put(self, audio_names, logmel):
+        logmel = logmel.detach().to('cpu', torch.float16).numpy()
+        for name, feature in zip(audio_names, logmel):
+            if name not in self.features:
+                self.features[name] = feature
+                self.pending.append(name)
+
+    def __call__(self, model, input, audio_names):
+        logmel = self.get(audio_names)
+        if logmel is None:
+            with torch.no_grad():
+                logmel = model.extract_logmel(input)
+            self.put(audio_names, logmel)
+            logmel = logmel.half()
+        # float16 storage, so computed and cached batches are numerically identical
+        return logmel.to(input.device).float()
+
+    def save(self):
+        """Write features added since the last save as a new shard (disk caches only)."""
+        if self.cache_dir is None or not self.pending:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        shard_name = f'shard_{len(self.shards):05d}.npy'
+        np.save(os.path.join(self.cache_dir, shard_name), np.stack([self.features[name] for name in self.pending]))
+        self.shards.append(shard_name)
+
+        index_path = os.path.join(self.cache_dir, INDEX_NAME)
+        names = []
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                names = json.load(f)['names']
+        names.append(self.pending)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump({'shards': self.shards, 'names': names}, f)
+        os.replace(index_path + '.tmp', index_path)
+        self.pending = []
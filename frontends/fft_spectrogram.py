@@ -0,0 +1,229 @@
+# File: frontends/fft_spectrogram.py
+
+import time
+
+import librosa
+import torch
+import torch.nn as nn
+from torchlibrosa.stft import Spectrogram, LogmelFilterBank
+
+from frontends.precision import fp32_forward
+
+
+class FFTSpectrogram(nn.Module):
+    def __init__(self, n_fft=2048, hop_length=None, win_length=None, window='hann', center=True,
+                 pad_mode='reflect', power=2.0, freq_range=None, freeze_parameters=True):
+        """
+        torchlibrosa's Spectrogram computed with torch.stft.
+
+        torchlibrosa evaluates the DFT as a Conv1d with n_fft-wide kernels, which
+        costs O(n_fft) per bin and frame; torch.stft is one FFT per frame.
+        freq_range=(lo, hi) keeps only bins lo..hi-1, e.g. the bins a mel
+        filterbank actually uses (BandedLogmelFilterBank.freq_range).
+
+        State dicts of torchlibrosa's Spectrogram load into this module: the
+        window is read back from its DFT kernels (the 0 Hz row of conv_real is
+        the window itself).
+        """
+        super(FFTSpectrogram, self).__init__()
+        self.n_fft = n_fft
+        self.hop_length = n_fft // 4 if hop_length is None else hop_length
+        self.center = center
+        self.pad_mode = pad_mode
+        self.power = power
+        self.freq_range = (0, n_fft // 2 + 1) if freq_range is None else tuple(freq_range)
+
+        win_length = n_fft if win_length is None else win_length
+        window = librosa.filters.get_window(window, win_length, fftbins=True)
+        window = librosa.util.pad_center(window, size=n_fft)
+        self.register_buffer('window', torch.tensor(window, dtype=torch.float), persistent=False)
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys,
+                              unexpected_keys, error_msgs):
+        conv_real = state_dict.pop(prefix + 'stft.conv_real.weight', None)
+        state_dict.pop(prefix + 'stft.conv_imag.weight', None)
+        if conv_real is not None and conv_real.shape[-1] == self.n_fft:
+            with torch.no_grad():
+                self.window.copy_(conv_real[0, 0])
+        super(FFTSpectrogram, self)._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+
+    @fp32_forward
+    def forward(self, input):
+        """
+        input: (batch_size, data_length)
+
+        Returns:
+            spectrogram: (batch_size, 1, time_steps, hi - lo)
+        """
+        lo, hi = self.freq_range
+        s = torch.stft(
+            input,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            window=self.window,
+            center=self.center,
+            pad_mode=self.pad_mode,
+            return_complex=True,
+        )
+        s = s[:, lo:hi].transpose(1, 2)
+        spectrogram = s.real ** 2 + s.imag ** 2
+        if self.power != 2.0:
+            spectrogram = spectrogram ** (self.power / 2.0)
+        return spectrogram[:, None, :, :]
+
+
+class BandedLogmelFilterBank(LogmelFilterBank):
+    def __init__(self, sr=22050, n_fft=2048, n_mels=64, fmin=0.0, fmax=None, is_log=True, ref=1.0,
+                 amin=1e-10, top_db=80.0, freeze_parameters=True, mel_block=16):
+        """
+        torchlibrosa's LogmelFilterBank applied as a banded operator.
+
+        Every mel filter is nonzero on a contiguous run of bins, so the filters
+        are split into blocks of mel_block and each block is multiplied only
+        with the bins it covers. The mel matrix stays the melW parameter, so
+        state dicts are interchangeable with LogmelFilterBank. Trainable
+        filterbanks (freeze_parameters=False) use the dense product.
+
+        Input may be the full spectrogram (n_fft // 2 + 1 bins) or only the
+        bins in freq_range, as returned by FFTSpectrogram(freq_range=...).
+        """
+        super(BandedLogmelFilterBank, self).__init__(
+            sr=sr, n_fft=n_fft, n_mels=n_mels, fmin=fmin, fmax=fmax, is_log=is_log, ref=ref,
+            amin=amin, top_db=top_db, freeze_parameters=freeze_parameters)
+        self.n_freqs = n_fft // 2 + 1
+        self.mel_block = mel_block
+        self._band_cache = None
+        self.freq_range = self.bands()[1]
+
+    def bands(self):
+        """
+        Returns:
+            blocks: list of (bin_start, bin_end, mel_start, mel_end)
+            freq_range: (lo, hi), the bins used by any filter
+        """
+        if torch.compiler.is_compiling() and self._band_cache is not None:
+            # Traced graphs bake in the bands; melW's pointer cannot be compared while tracing
+            return self._band_cache[1]
+        key = (self.melW.data_ptr(), self.melW._version)
+        if self._band_cache is None or self._band_cache[0] != key:
+            support = (self.melW.detach() != 0).cpu()
+            blocks = []
+            for m0 in range(0, support.shape[1], self.mel_block):
+                m1 = min(m0 + self.mel_block, support.shape[1])
+                bins = support[:, m0:m1].any(dim=1).nonzero().flatten().tolist()
+                if bins:
+                    blocks.append((bins[0], bins[-1] + 1, m0, m1))
+            freq_range = (min(b[0] for b in blocks), max(b[1] for b in blocks)) if blocks else (0, 0)
+            self._band_cache = (key, (blocks, freq_range))
+        return self._band_cache[1]
+
+    @fp32_forward
+    def forward(self, input):
+        r"""Calculate (log) mel spectrogram from spectrogram.
+
+        Args:
+            input: (*, n_fft // 2 + 1) or (*, hi - lo), spectrogram
+
+        Returns:
+            output: (*, mel_bins), (log) mel spectrogram
+        """
+        blocks, (lo, hi) = self.bands()
+        if input.shape[-1] == self.n_freqs:
+            offset = 0
+        elif input.shape[-1] == hi - lo:
+            offset = lo
+        else:
+            raise ValueError(f"Expected {self.n_freqs} or {hi - lo} frequency bins, got {input.shape[-1]}")
+
+        if self.melW.requires_grad:
+            mel_spectrogram = torch.matmul(input, self.melW[offset:offset + input.shape[-1]])
+        else:
+            mel_spectrogram = input.new_zeros(input.shape[:-1] + (self.melW.shape[1],))
+            for b0, b1, m0, m1 in blocks:
+                mel_spectrogram[..., m0:m1] = torch.matmul(
+                    input[..., b0 - offset:b1 - offset], self.melW[b0:b1, m0:m1])
+
+        if self.is_log:
+            return self.power_to_db(mel_spectrogram)
+        return mel_spectrogram
+
+
+class Float32Spectrogram(Spectrogram):
+    """torchlibrosa's Spectrogram, kept in float32 under autocast (|X|^2 overflows float16)."""
+    forward = fp32_forward(Spectrogram.forward)
+
+
+class Float32LogmelFilterBank(LogmelFilterBank):
+    """torchlibrosa's LogmelFilterBank, kept in float32 under autocast."""
+    forward = fp32_forward(LogmelFilterBank.forward)
+
+
+def build_logmel_extractors(stft_engine, sample_rate, window_size, hop_size, mel_bins, fmin, fmax,
+                            window='hann', center=True, pad_mode='reflect', ref=1.0, amin=1e-10,
+                            top_db=None):
+    """
+    Spectrogram and log-mel extractors of the templates.
+
+    stft_engine: 'conv' for torchlibrosa's Spectrogram/LogmelFilterBank, 'fft'
+        for FFTSpectrogram/BandedLogmelFilterBank (same state dict, only the
+        bins inside [fmin, fmax] are computed)
+
+    Returns:
+        (spectrogram_extractor, logmel_extractor)
+    """
+    if stft_engine == 'conv':
+        spectrogram_extractor = Float32Spectrogram(n_fft=window_size, hop_length=hop_size,
+            win_length=window_size, window=window, center=center, pad_mode=pad_mode,
+            freeze_parameters=True)
+        logmel_extractor = Float32LogmelFilterBank(sr=sample_rate, n_fft=window_size,
+            n_mels=mel_bins, fmin=fmin, fmax=fmax, ref=ref, amin=amin, top_db=top_db,
+            freeze_parameters=True)
+    elif stft_engine == 'fft':
+        logmel_extractor = BandedLogmelFilterBank(sr=sample_rate, n_fft=window_size,
+            n_mels=mel_bins, fmin=fmin, fmax=fmax, ref=ref, amin=amin, top_db=top_db,
+            freeze_parameters=True)
+        spectrogram_extractor = FFTSpectrogram(n_fft=window_size, hop_length=hop_size,
+            win_length=window_size, window=window, center=center, pad_mode=pad_mode,
+            freq_range=logmel_extractor.freq_range, freeze_parameters=True)
+    else:
+        raise ValueError(f"Unknown stft_engine: {stft_engine}")
+    return spectrogram_extractor, logmel_extractor
+
+
+def benchmark(batch_size=32, sample_rate=128000, window_size=2048, hop_size=1024, mel_bins=64,
+              fmin=50, fmax=None, steps=3):
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    fmax = sample_rate // 2 if fmax is None else fmax
+    x = torch.randn(batch_size, sample_rate * 2, device=device)
+
+    outputs = {}
+    for engine in ['conv', 'fft']:
+        spectrogram_extractor, logmel_extractor = build_logmel_extractors(
+            engine, sample_rate, window_size, hop_size, mel_bins, fmin, fmax)
+        spectrogram_extractor.to(device)
+        logmel_extractor.to(device)
+        if engine == 'fft':
+            # Load the torchlibrosa modules' state dicts
+            spectrogram_extractor.load_state_dict(conv_state[0])
+            logmel_extractor.load_state_dict(conv_state[1])
+        else:
+            conv_state = (spectrogram_extractor.state_dict(), logmel_extractor.state_dict())
+        with torch.no_grad():
+            logmel_extractor(spectrogram_extractor(x))
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            for _ in range(steps):
+                outputs[engine] = logmel_extractor(spectrogram_extractor(x))
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+        print(f"{engine:>5}: {(time.perf_counter() - start) / steps * 1000:8.1f} ms")
+
+    lo, hi = logmel_extractor.freq_range
+    print(f"Log-mel {tuple(outputs['fft'].shape)} on {device}, bins {lo}..{hi - 1} of {window_size // 2 + 1}")
+    print(f"Max abs difference: {(outputs['fft'] - outputs['conv']).abs().max().item():.2e} dB")
+
+
+if __name__ == '__main__':
+    benchmark()
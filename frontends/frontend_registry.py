@@ -0,0 +1,168 @@
+# File: frontends/frontend_registry.py
+
+import torch
+
+
+def build_mfcc(sample_rate, window_size, hop_size, mel_bins, fmin, fmax, **kwargs):
+    import torchaudio
+    return torchaudio.transforms.MFCC(
+        sample_rate=sample_rate,
+        n_mfcc=mel_bins,  # This determines the number of MFCC coefficients
+        melkwargs={
+            "n_fft": window_size,
+            "n_mels": mel_bins,
+            "hop_length": hop_size,
+            "f_min": fmin,
+            "f_max": fmax,
+            "center": True,
+            "pad_mode": 'reflect'
+        }
+    )
+
+
+def build_chroma(sample_rate, window_size, hop_size, mel_bins, **kwargs):
+    from frontends.chroma.frontend import Chroma
+    return Chroma(
+        sample_rate=sample_rate,
+        n_fft=window_size,
+        hop_length=hop_size,
+        win_length=window_size,
+        n_chroma=mel_bins,
+        tuning=0.0,
+    )
+
+
+def build_ensemble(sample_rate, window_size, hop_size, mel_bins, fmin, fmax, **kwargs):
+    from frontends.ensemble.frontend import EnsembleFeatures
+    return EnsembleFeatures(
+        sample_rate=sample_rate,
+        n_fft=window_size,
+        hop_length=hop_size,
+        n_mels=mel_bins,
+        fmin=fmin,
+        fmax=fmax,
+        ref=1.0,
+        amin=1e-10,
+        top_db=None,
+    )
+
+
+def build_leaf(sample_rate, **kwargs):
+    from frontends.leaf.frontend import Leaf
+    return Leaf(
+        n_filters=40,
+        sample_rate=sample_rate,
+        window_len=16,
+        window_stride=8,
+        init_min_freq=50.0,
+        init_max_freq=sample_rate // 2,
+        engine="fft",
+    )
+
+
+def build_diffres(sample_rate, hop_size, mel_bins, **kwargs):
+    from frontends.diffres.frontend import DiffRes
+    return DiffRes(
+        in_t_dim=int((sample_rate / hop_size) * 2) + 1,
+        in_f_dim=mel_bins,
+        dimension_reduction_rate=0.60,
+        learn_pos_emb=False
+    )
+
+
+def build_dmel(window_size, hop_size, **kwargs):
+    from frontends.dmel.frontend import DMel
+    return DMel(
+        init_lambd=5.0,
+        n_fft=window_size,
+        win_length=window_size,
+        hop_length=hop_size
+    )
+
+
+def build_dstft(sample_rate, window_size, hop_size, device, **kwargs):
+    from frontends.dstft.frontend import DSTFT
+    return DSTFT(
+        x=None,
+        length=sample_rate*2,
+        device=device,
+        keep_intermediates=False,
+        win_length=window_size,
+        support=window_size,
+        stride=hop_size,
+        pow=2,
+        win_pow=2,
+        win_requires_grad=True,
+        stride_requires_grad=True,
+        pow_requires_grad=False,
+        win_p="t",
+        win_min=window_size//2,
+        win_max=window_size,
+        stride_min=hop_size//2,
+        stride_max=hop_size,
+        sr=sample_rate,
+    )
+
+
+def build_sincnet(sample_rate, window_size, hop_size, mel_bins, **kwargs):
+    from frontends.sincnet.frontend import SincNet
+    return SincNet(
+        out_channels=mel_bins,
+        sample_rate=sample_rate,
+        kernel_size=hop_size,
+        window_size=window_size,
+        hop_size=hop_size,
+    )
+
+
+# Frontend name -> {template attribute: builder} of the extractors it needs.
+# The Spectrogram/LogmelFilterBank extractors are always built by the templates.
+FRONTEND_REGISTRY = {
+    'logmel': {},
+    'mixup': {},
+    'chroma': {'chroma_extractor': build_chroma},
+    'mfcc': {'mfcc_extractor': build_mfcc},
+    'ensemble': {'ensemble_extractor': build_ensemble},
+    'leaf': {'leaf_extractor': build_leaf},
+    'diffres': {'diffres_extractor': build_diffres},
+    'dmel': {'dmel_extractor': build_dmel},
+    'dstft': {'dstft_extractor': build_dstft},
+    'sincnet': {'sincnet_extractor': build_sincnet},
+}
+
+
+# Template attributes holding frontend modules: the always-built spectrogram/log-mel
+# extractors and every extractor the registry can build
+FRONTEND_ATTRIBUTES = ('spectrogram_extractor', 'logmel_extractor') + tuple(
+    dict.fromkeys(name for builders in FRONTEND_REGISTRY.values() for name in builders))
+
+
+def frontend_modules(model):
+    """The frontend modules a model holds, each once (templates share them with their base model)."""
+    modules = []
+    for name in FRONTEND_ATTRIBUTES:
+        module = getattr(model, name, None)
+        if isinstance(module, torch.nn.Module) and all(module is not m for m in modules):
+            modules.append(module)
+    return modules
+
+
+def build_frontend_extractors(frontend, sample_rate, window_size, hop_size, mel_bins, fmin, fmax,
+                              batch_size=200, device=None):
+    """
+    Build only the extractors the selected frontend uses.
+
+    Unknown frontend names fall back to the templates' log-mel path and build nothing.
+
+    Returns:
+        dict mapping template attribute names (e.g. 'leaf_extractor') to modules
+    """
+    if device is None:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    builders = FRONTEND_REGISTRY.get(frontend, {})
+    return {
+        name: builder(sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+                      mel_bins=mel_bins, fmin=fmin, fmax=fmax, batch_size=batch_size,
+                      device=device).to(device)
+        for name, builder in builders.items()
+    }
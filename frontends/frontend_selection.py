@@ -1,26 +1,138 @@
 # File: frontend/frontend.py
 
+import math
+import contextlib
+
 import torch
 import torch.nn.functional as F
 
-def process_outputs(model, args, inputs, targets, criterion):
-    
+from frontends.feature_cache import LogmelCache
+
+LOGMEL_CACHE_MODELS = ('panns_cnn6', 'panns_resnet22', 'panns_mobilenetv1', 'ast')
+
+def get_feature_cache(args):
+    """Log-mel feature cache for the deterministic 'logmel' frontend, or None."""
+    if args.feature_cache == 'none':
+        return None
+    if args.frontend != 'logmel' or args.model_name not in LOGMEL_CACHE_MODELS:
+        print(f"Feature cache disabled: only supported for the logmel frontend of {', '.join(LOGMEL_CACHE_MODELS)}")
+        return None
+    if args.feature_cache == 'disk' and args.feature_cache_dir is None:
+        raise ValueError("--feature_cache disk requires --feature_cache_dir")
+    return LogmelCache(
+        sample_rate=args.sample_rate,
+        window_size=args.window_size,
+        hop_size=args.hop_size,
+        mel_bins=args.mel_bins,
+        fmin=args.fmin,
+        fmax=args.fmax,
+        resampler=args.resampler,
+        stft_engine=args.stft_engine,
+        cache_dir=args.feature_cache_dir if args.feature_cache == 'disk' else None,
+    )
+
+PRECISION_DTYPES = {'fp16': torch.float16, 'bf16': torch.bfloat16}
+
+def get_autocast(args, device):
+    """Autocast context factory for --precision; fp32 returns a no-op context."""
+    if args.precision == 'fp32':
+        return contextlib.nullcontext
+    dtype = PRECISION_DTYPES[args.precision]
+    return lambda: torch.autocast(device_type=device.type, dtype=dtype)
+
+def get_grad_scaler(args, device):
+    """Loss scaler for fp16 training; disabled (a pass-through) for fp32 and bf16."""
+    return torch.amp.GradScaler(device.type, enabled=args.precision == 'fp16')
+
+def get_micro_batch_size(args):
+    """
+    Examples per forward/backward pass: --micro_batch_size, else batch_size split into --accum_steps.
+
+    With --compile, every training micro-batch must be full (the training
+    loaders drop their last short batch), so batch_size has to be a multiple
+    of it: training batches are never padded, see pad_batch.
+    """
+    if args.micro_batch_size is not None:
+        micro_batch_size = args.micro_batch_size
+    else:
+        micro_batch_size = math.ceil(args.batch_size / args.accum_steps)
+    if args.compile != 'none' and args.batch_size % micro_batch_size:
+        raise ValueError(f"--compile needs batch_size ({args.batch_size}) to be a multiple of "
+                         f"the micro-batch size ({micro_batch_size})")
+    return micro_batch_size
+
+def split_batch(micro_batch_size, *tensors):
+    """Yield tuples of micro-batches of at most micro_batch_size examples; None entries pass through."""
+    for start in range(0, tensors[0].shape[0], micro_batch_size):
+        yield tuple(t[start:start + micro_batch_size] if t is not None else None for t in tensors)
+
+def configure_batchnorm(model, args):
+    """
+    Adapt the BatchNorm layers to micro-batching (--bn_mode). Call once, after building the model.
+
+    accum: batch statistics are per micro-batch, and the running-stat momentum
+        m becomes 1 - (1 - m) ** (1 / k) for k micro-batches per batch, so the
+        running averages decay per optimizer step as with full batches
+    micro, frozen: momentum unchanged (frozen layers are put in eval mode by freeze_batchnorm)
+    """
+    steps = math.ceil(args.batch_size / get_micro_batch_size(args))
+    if args.bn_mode != 'accum' or steps == 1:
+        return
+    for module in model.modules():
+        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm) and module.momentum is not None:
+            module.momentum = 1 - (1 - module.momentum) ** (1 / steps)
+
+def freeze_batchnorm(model):
+    """Put the BatchNorm layers in eval mode (running statistics, no updates); call after model.train()."""
+    for module in model.modules():
+        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+            module.eval()
+
+def pad_batch(batch_size, *tensors):
+    """
+    Pad every tensor along the batch dimension to batch_size by repeating its
+    leading examples, so a short last batch keeps the compiled graphs' shapes.
+    None entries pass through.
+
+    For evaluation only: in train mode the copies would still enter the
+    BatchNorm batch statistics and running stats and could be drawn as mixup
+    partners. Callers drop the padded outputs with outputs[:n_valid].
+
+    Returns:
+        the padded tensors followed by the number of real examples
+    """
+    n_valid = tensors[0].shape[0]
+    if n_valid == batch_size:
+        return (*tensors, n_valid)
+    idx = torch.arange(batch_size, device=tensors[0].device) % n_valid
+    return (*(t[idx] if t is not None else None for t in tensors), n_valid)
+
+def to_labels(targets):
+    """Class indices from one-hot targets, or the targets themselves if they already are labels."""
+    return targets.argmax(dim=-1) if targets.dim() > 1 else targets
+
+def process_outputs(model, args, inputs, targets, criterion, features=None):
+    """Loss and outputs of a training (micro-)batch; features are cached log-mels, if any."""
+
     if any(keyword in args.model_name for keyword in ('panns', 'ast')):
-        output_dict = model(inputs)
+        if features is not None:
+            output_dict = model(inputs, logmel=features)
+        else:
+            output_dict = model(inputs)
         outputs = output_dict['clipwise_output']
     else:
         outputs = model(inputs)
 
+    labels = to_labels(targets)
+
     if args.frontend == 'mixup':
-        mixup_lambda = output_dict['mixup_lambda']
+        mixup_lambda = output_dict['mixup_lambda'].reshape(-1)
         rn_indices = output_dict['rn_indices']
-        bs = inputs.size(0)
-        labels = targets.argmax(dim=-1)
-        samples_loss = (F.cross_entropy(outputs, labels, reduction="none") * mixup_lambda.reshape(bs) +
-                        F.cross_entropy(outputs, labels[rn_indices], reduction="none") * (1. - mixup_lambda.reshape(bs)))
+        samples_loss = (F.cross_entropy(outputs, labels, reduction="none") * mixup_lambda +
+                        F.cross_entropy(outputs, labels[rn_indices], reduction="none") * (1. - mixup_lambda))
         return samples_loss.mean(), outputs
     elif args.frontend == 'diffres':
         diffres_loss = output_dict['diffres_loss']
-        return diffres_loss + criterion(outputs, targets.argmax(dim=-1)), outputs
+        return diffres_loss + criterion(outputs, labels), outputs
     else:
-        return criterion(outputs, targets.argmax(dim=-1)), outputs
+        return criterion(outputs, labels), outputs
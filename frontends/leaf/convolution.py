@@ -67,8 +67,9 @@ class GaborConv1d(nn.Module):
         self.use_legacy_complex = use_legacy_complex
         if self.use_legacy_complex:
             print("ATTENTION: Using legacy_complex format for gabor filter estimation.")
+        self._filter_cache = None
 
-    def forward(self, x):
+    def filter_bank(self):
         # apply Gabor constraint
         kernel = self.constraint(self._kernel)
         if self._sort_filters:
@@ -88,6 +89,21 @@ class GaborConv1d(nn.Module):
         stacked_filters = torch.cat([real_filters.unsqueeze(1), img_filters.unsqueeze(1)], dim=1)
         stacked_filters = torch.reshape(stacked_filters, (2 * self._filters, self._kernel_size))
         stacked_filters = stacked_filters.unsqueeze(1)
+        return stacked_filters
+
+    def get_filters(self):
+        # Filters are cached while no gradient can reach the Gabor parameters
+        # (eval under no_grad, frozen frontend) and the parameters are unchanged.
+        if torch.is_grad_enabled() and self._kernel.requires_grad:
+            self._filter_cache = None
+            return self.filter_bank()
+        key = (self._kernel.data_ptr(), self._kernel._version)
+        if self._filter_cache is None or self._filter_cache[0] != key:
+            self._filter_cache = (key, self.filter_bank())
+        return self._filter_cache[1]
+
+    def forward(self, x):
+        stacked_filters = self.get_filters()
         if self._padding.lower() == "same":
             x = nn.functional.pad(x, self._pad_value, mode='constant', value=0)
             pad_val = 0
@@ -97,3 +113,27 @@ class GaborConv1d(nn.Module):
         output = nn.functional.conv1d(x, stacked_filters,
                                       bias=self._bias, stride=self._strides, padding=pad_val)
         return output
+
+    def forward_fft(self, x):
+        """
+        Same output as forward() for stride 1, computed as one FFT correlation.
+
+        Costs O(L log L) per filter instead of O(L * kernel_size), which is what
+        makes long (e.g. 2049-tap at 128 kHz) Gabor filters affordable.
+        """
+        if self._strides != 1:
+            raise ValueError("forward_fft only supports stride 1")
+        stacked_filters = self.get_filters()[:, 0]
+        if self._padding.lower() == "same":
+            x = nn.functional.pad(x, self._pad_value, mode='constant', value=0)
+        else:
+            x = nn.functional.pad(x, (self._pad_value, self._pad_value), mode='constant', value=0)
+
+        # out[n] = sum_k x[n + k] h[k]: circular correlation X * conj(H), exact for n_fft >= padded length
+        length = x.shape[-1] - self._kernel_size + 1
+        n_fft = 2 ** math.ceil(math.log2(x.shape[-1]))
+        spectrum = torch.fft.rfft(x, n=n_fft) * torch.fft.rfft(stacked_filters, n=n_fft).conj()
+        output = torch.fft.irfft(spectrum, n=n_fft)[..., :length]
+        if self._bias is not None:
+            output = output + self._bias.view(1, -1, 1)
+        return output
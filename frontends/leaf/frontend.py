@@ -5,6 +5,7 @@ from frontends.leaf import initializers
 from frontends.leaf import pooling
 from frontends.leaf import postprocessing
 from frontends.leaf import utils
+from frontends.precision import fp32_forward
 
 
 class SquaredModulus(nn.Module):
@@ -12,6 +13,7 @@ class SquaredModulus(nn.Module):
         super(SquaredModulus, self).__init__()
         self._pool = nn.AvgPool1d(kernel_size=2, stride=2)
 
+    @fp32_forward
     def forward(self, x):
         x = x.transpose(1, 2)
         output = 2 * self._pool(x ** 2.)
@@ -32,9 +34,15 @@ class Leaf(nn.Module):
             mean_var_norm: bool = False,
             pcen_compression: bool = True,
             use_legacy_complex=False,
-            initializer="default"
+            initializer="default",
+            engine: str = "direct"
     ):
         super(Leaf, self).__init__()
+        if engine not in ("direct", "fft"):
+            raise ValueError(f"Unsupported engine: {engine}")
+        # "direct": stride-1 conv1d Gabor filterbank, "fft": the same filterbank as an
+        # FFT correlation with the squared modulus fused in (see GaborConv1d.forward_fft)
+        self._engine = engine
         window_size = int(sample_rate * window_len // 1000 + 1)
         window_stride = int(sample_rate * window_stride // 1000)
         if preemp:
@@ -78,8 +86,12 @@ class Leaf(nn.Module):
     def forward(self, x):
         if self._preemp:
             x = self._preemp(x)
-        outputs = self._complex_conv(x)
-        outputs = self._activation(outputs)
+        if self._engine == "fft":
+            outputs = self._complex_conv.forward_fft(x)
+            outputs = outputs[:, 0::2] ** 2. + outputs[:, 1::2] ** 2.
+        else:
+            outputs = self._complex_conv(x)
+            outputs = self._activation(outputs)
         outputs = self._pooling(outputs)
         outputs = torch.maximum(outputs, torch.tensor(1e-5, device=outputs.device))
         if self._compression:
@@ -3,6 +3,7 @@ from torch import nn
 from torch.nn import functional as F
 from frontends.leaf import impulse_responses
 from frontends.leaf.utils import get_padding_value
+from frontends.precision import fp32_forward
 
 
 class GaussianLowPass(nn.Module):
@@ -27,11 +28,26 @@ class GaussianLowPass(nn.Module):
             self.pad_value = get_padding_value(kernel_size)
         else:
             self.pad_value = self.padding
+        self._kernel_cache = None
 
-    def forward(self, x):
+    def lowpass_kernels(self):
         kernel = impulse_responses.gaussian_lowpass(self.weights, self.kernel_size)
         kernel = kernel.reshape(-1, self.kernel_size, self.in_channels)
-        kernel = kernel.permute(2, 0, 1)
+        return kernel.permute(2, 0, 1)
+
+    def get_kernels(self):
+        # Kernels are cached while no gradient can reach the widths and they are unchanged
+        if torch.is_grad_enabled() and self.weights.requires_grad:
+            self._kernel_cache = None
+            return self.lowpass_kernels()
+        key = (self.weights.data_ptr(), self.weights._version)
+        if self._kernel_cache is None or self._kernel_cache[0] != key:
+            self._kernel_cache = (key, self.lowpass_kernels())
+        return self._kernel_cache[1]
+
+    @fp32_forward
+    def forward(self, x):
+        kernel = self.get_kernels()
 
         if self.padding.lower() == "same":
             x = nn.functional.pad(x, self.pad_value, mode='constant', value=0)
@@ -1,6 +1,57 @@
+import math
+
 import torch
 from torch import nn
 
+from frontends.precision import fp32_forward
+
+
+def ema_scan(x, w, initial_state):
+    """
+    Exponential moving average over the last axis, without a loop over frames.
+
+    Computes acc_t = w * x_t + (1 - w) * acc_{t-1} with acc_{-1} = initial_state
+    as a two-level blocked scan: time is split into chunks of ~sqrt(T) frames,
+    the EMA within every chunk is one matmul with a lower-triangular decay
+    matrix, and the states carried across chunks are a second, smaller one.
+    Only powers of (1 - w) <= 1 appear, so it is stable in float32, and
+    gradients (including w.r.t. w) come from autograd.
+
+    x: (batch_size, channels, time_steps)
+    w: (channels,) or (1,) smoothing coefficients in [0, 1]
+    initial_state: (batch_size, channels)
+    """
+    time_steps = x.shape[-1]
+    chunk = max(1, math.ceil(math.sqrt(time_steps)))
+    num_chunks = math.ceil(time_steps / chunk)
+    x = nn.functional.pad(x, (0, num_chunks * chunk - time_steps))
+    x = x.view(x.shape[0], x.shape[1], num_chunks, chunk)
+
+    # (1 - w) per channel; clamped away from 0 so that 0 ** 0 keeps a finite gradient
+    decay = (1.0 - w).clamp(min=1e-12).view(-1, 1, 1)
+
+    def decay_matrix(n, step):
+        # M[i, j] = decay ** (step * (i - j)) for i >= j, else 0
+        idx = torch.arange(n, device=x.device)
+        lags = idx[:, None] - idx[None, :]
+        powers = decay ** (step * lags.clamp(min=0)).to(x.dtype)
+        return torch.where(lags >= 0, powers, torch.zeros_like(powers))
+
+    # EMA of every chunk started from a zero state
+    local = w.view(-1, 1, 1) * torch.matmul(x, decay_matrix(chunk, 1).transpose(-1, -2))
+
+    # state at the end of every chunk, then the state entering every chunk
+    ends = torch.matmul(local[..., -1:].transpose(-1, -2),
+                        decay_matrix(num_chunks, chunk).transpose(-1, -2)).squeeze(-2)
+    carry = decay.view(-1, 1) ** (chunk * torch.arange(1, num_chunks + 1, device=x.device)).to(x.dtype)
+    ends = ends + carry * initial_state.unsqueeze(-1)
+    entering = torch.cat([initial_state.unsqueeze(-1), ends[..., :-1]], dim=-1)
+
+    # add the decayed incoming state within every chunk
+    within = decay ** torch.arange(1, chunk + 1, device=x.device).to(x.dtype)
+    out = local + entering.unsqueeze(-1) * within.view(decay.shape[0], 1, chunk)
+    return out.view(x.shape[0], x.shape[1], -1)[..., :time_steps]
+
 
 class ExponentialMovingAverage(nn.Module):
     def __init__(self, in_channels, coeff_init, per_channel: bool = False):
@@ -13,19 +64,7 @@ class ExponentialMovingAverage(nn.Module):
     def forward(self, x):
         w = torch.clamp(self._weights, min=0., max=1.)
         initial_state = x[:, :, 0]
-
-        def scan(init_state, x, w):
-            x = x.permute(2, 0, 1)
-            acc = init_state
-            results = []
-            for ix in range(len(x)):
-                acc = (w * x[ix]) + ((1.0 - w) * acc)
-                results.append(acc.unsqueeze(0))
-            results = torch.cat(results, dim=0)
-            results = results.permute(1, 2, 0)
-            return results
-
-        return scan(initial_state, x, w)
+        return ema_scan(x, w, initial_state)
 
 
 class PCENLayer(nn.Module):
@@ -59,6 +98,7 @@ class PCENLayer(nn.Module):
         else:
             raise ValueError("SimpleRNN based ema not implemented.")
 
+    @fp32_forward
     def forward(self, x):
         alpha = torch.min(self.alpha, torch.tensor(1.0, dtype=x.dtype, device=x.device))
         root = torch.max(self.root, torch.tensor(1.0, dtype=x.dtype, device=x.device))
@@ -0,0 +1,25 @@
+# File: frontends/precision.py
+
+import functools
+
+import torch
+
+
+def fp32_forward(forward):
+    """
+    Run a module's forward in float32 with autocast disabled.
+
+    For numerically sensitive frontend stages (power spectra, log compression,
+    PCEN, cumulative sums) that overflow or lose too much precision in
+    float16/bfloat16. Outside autocast the forward runs unchanged; inside it,
+    floating-point tensor arguments are cast to float32 first.
+    """
+    @functools.wraps(forward)
+    def wrapper(self, *args, **kwargs):
+        device_type = next((a.device.type for a in args if torch.is_tensor(a)), 'cpu')
+        if not torch.is_autocast_enabled(device_type):
+            return forward(self, *args, **kwargs)
+        args = [a.float() if torch.is_tensor(a) and a.is_floating_point() else a for a in args]
+        with torch.autocast(device_type=device_type, enabled=False):
+            return forward(self, *args, **kwargs)
+    return wrapper
@@ -3,12 +3,58 @@ import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 
+def fft_conv1d(waveforms, filters, stride=1, padding=0):
+    """
+    F.conv1d(waveforms, filters, stride=stride, padding=padding) computed with FFTs.
+
+    The padded signal and the kernels are split into ``stride`` polyphase
+    components, so only the strided outputs are computed: one FFT per
+    component, a contraction over components per frequency, and one inverse
+    FFT per (example, filter). Cost grows with the signal length instead of
+    kernel_size x frames, which pays off for kernels much longer than the stride.
+
+    waveforms: (batch_size, 1, data_length)
+    filters: (out_channels, 1, kernel_size)
+    """
+    kernel_size = filters.shape[-1]
+    x = F.pad(waveforms[:, 0], (padding, padding))
+    frames = (x.shape[-1] - kernel_size) // stride + 1
+    taps = -(-kernel_size // stride)  # kernel length per polyphase component
+
+    # x_r[m] = x[m * stride + r], h_r[j] = h[j * stride + r]
+    length = (frames + taps - 1) * stride
+    x = F.pad(x, (0, max(0, length - x.shape[-1])))[:, :length]
+    x = x.view(x.shape[0], -1, stride).transpose(1, 2)  # (batch, stride, frames + taps - 1)
+    h = F.pad(filters[:, 0], (0, taps * stride - kernel_size))
+    h = h.view(h.shape[0], taps, stride).transpose(1, 2)  # (out_channels, stride, taps)
+
+    # out[t] = sum_r sum_j x_r[t + j] h_r[j], a correlation: X * conj(H)
+    n_fft = frames + taps - 1
+    X = torch.fft.rfft(x, n=n_fft)
+    H = torch.fft.rfft(h, n=n_fft)
+    Y = torch.einsum('brf,crf->bcf', X, H.conj())
+    return torch.fft.irfft(Y, n=n_fft)[..., :frames]
+
+
 class SincConv(nn.Module):
-    def __init__(self, out_channels, kernel_size, sample_rate):
+    """
+    Sinc band-pass filterbank applied as a strided convolution.
+
+    params:
+        stride: hop between output frames, in samples
+        conv_mode: 'direct' (F.conv1d), 'fft' (fft_conv1d) or 'auto' (fft when
+            kernel_size >= 16 * stride, below which strided conv1d is faster)
+    """
+
+    def __init__(self, out_channels, kernel_size, sample_rate, stride=1024, conv_mode='auto'):
         super(SincConv, self).__init__()
+        if conv_mode not in ('direct', 'fft', 'auto'):
+            raise ValueError(f"Unsupported conv_mode: {conv_mode}")
         self.out_channels = out_channels
         self.kernel_size = kernel_size
         self.sample_rate = sample_rate
+        self.stride = stride
+        self.conv_mode = conv_mode
         
         # Define low and high cutoff frequencies (randomly initialized)
         low_freq_mel = 80  # Initial lower bound for cutoff frequencies in Hz
@@ -20,39 +66,51 @@ class SincConv(nn.Module):
 
         # Hamming window to apply to sinc function (size = kernel_size)
         n_lin = torch.linspace(0, (kernel_size - 1), steps=kernel_size)
-        self.window = 0.54 - 0.46 * torch.cos(2 * np.pi * n_lin / kernel_size)
+        self.register_buffer('window', 0.54 - 0.46 * torch.cos(2 * np.pi * n_lin / kernel_size), persistent=False)
 
         # Time axis for the filter (centered, size = kernel_size)
         n = (self.kernel_size) // 2  # Now n is 1024 for kernel_size = 2048
-        self.n_ = torch.arange(-n, n).float() / self.sample_rate  # Full kernel_size range
-        self.n_ = 2 * np.pi * self.n_
+        n_ = torch.arange(-n, n).float() / self.sample_rate  # Full kernel_size range
+        self.register_buffer('n_', 2 * np.pi * n_, persistent=False)
 
-    def forward(self, waveforms):
-        # Ensure all tensors are on the same device as the input waveforms
-        device = waveforms.device
-        self.n_ = self.n_.to(device)
-        self.window = self.window.to(device)
-        low = torch.abs(self.low_hz_).to(device)
-        band = torch.abs(self.band_hz_).to(device)
+        # Filters of the last parameter version, reused while they cannot change
+        self._filters = None
+
+    def filterbank(self):
+        """All band-pass filters at once: (out_channels, 1, kernel_size)."""
+        low = torch.abs(self.low_hz_)[:, None]
+        band = torch.abs(self.band_hz_)[:, None]
 
         high = torch.clamp(low + band, self.sample_rate * 0.1, self.sample_rate / 2)
-        filters = []
-        for i in range(self.out_channels):
-            # Generate band-pass filter using sinc function
-            low_pass1 = 2 * low[i] * torch.sinc(low[i] * self.n_)
-            low_pass2 = 2 * high[i] * torch.sinc(high[i] * self.n_)
-            band_pass = low_pass2 - low_pass1
-            band_pass = band_pass * self.window  # Apply the window to the band-pass filter
-            filters.append(band_pass)
-        
-        # Stack filters and prepare for 1D convolution
-        filters = torch.stack(filters).view(self.out_channels, 1, -1).to(device)
-        
-        return F.conv1d(waveforms, filters, stride=1024, padding=self.kernel_size // 2)
+        low_pass1 = 2 * low * torch.sinc(low * self.n_)
+        low_pass2 = 2 * high * torch.sinc(high * self.n_)
+        band_pass = (low_pass2 - low_pass1) * self.window  # Apply the window to the band-pass filter
+        return band_pass.view(self.out_channels, 1, -1)
+
+    def get_filters(self):
+        # Rebuilding is only needed when gradients flow to the cutoffs; otherwise
+        # the filters are cached until the parameters change (eval, frozen frontend).
+        params = (self.low_hz_, self.band_hz_)
+        if torch.is_grad_enabled() and any(p.requires_grad for p in params):
+            self._filters = None
+            return self.filterbank()
+
+        key = tuple((p.data_ptr(), p._version) for p in params)
+        if self._filters is None or self._filters[0] != key:
+            self._filters = (key, self.filterbank())
+        return self._filters[1]
+
+    def forward(self, waveforms):
+        filters = self.get_filters()
+        use_fft = self.conv_mode == 'fft' or (self.conv_mode == 'auto' and self.kernel_size >= 16 * self.stride)
+        if use_fft:
+            return fft_conv1d(waveforms, filters, stride=self.stride, padding=self.kernel_size // 2)
+        return F.conv1d(waveforms, filters, stride=self.stride, padding=self.kernel_size // 2)
 
 
 class SincNet(nn.Module):
-    def __init__(self, out_channels, sample_rate=128000, kernel_size=2048, window_size=2048, hop_size=1024):
+    def __init__(self, out_channels, sample_rate=128000, kernel_size=2048, window_size=2048, hop_size=1024,
+                 conv_mode='auto'):
         super(SincNet, self).__init__()
         self.sample_rate = sample_rate
         self.kernel_size = kernel_size
@@ -60,7 +118,8 @@ class SincNet(nn.Module):
         self.window_size = window_size
         
         # Sinc-conv layer with 64 filters (equivalent to 64 mel bands)
-        self.sinc_conv = SincConv(out_channels=out_channels, kernel_size=self.kernel_size, sample_rate=self.sample_rate)
+        self.sinc_conv = SincConv(out_channels=out_channels, kernel_size=self.kernel_size, sample_rate=self.sample_rate,
+                                  stride=self.hop_size, conv_mode=conv_mode)
 
     def forward(self, x):
         # x: [batch, 1, audio_length], raw waveform input
@@ -1,6 +1,15 @@
 # File: wandb_logging/metrics_logging.py
 
+import resource
+
+import torch
 import wandb
 
 def log_metrics(metrics_dict):
     wandb.log(metrics_dict)
+
+def peak_memory_mib(device):
+    """Peak allocated CUDA memory since the last reset, or the process' peak RSS on CPU."""
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 2 ** 20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
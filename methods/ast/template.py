@@ -21,14 +21,10 @@ import torch.utils.data
 import torchaudio
 import librosa
 
-from frontends.leaf.frontend import Leaf
-from frontends.diffres.frontend import DiffRes
-from frontends.dmel.frontend import DMel
-from frontends.dstft.frontend import DSTFT
-from frontends.sincnet.frontend import SincNet
+from frontends.frontend_registry import build_frontend_extractors
+from frontends.fft_spectrogram import build_logmel_extractors
 
-from torchlibrosa.stft import Spectrogram, LogmelFilterBank
-from torchlibrosa.augmentation import SpecAugmentation
+from methods.panns.pytorch_utils import SpecAugmentation
 
 from methods.ast.models import ASTModel
 
@@ -54,7 +50,7 @@ class AudioSpectrogramTransformer(nn.Module):
                  fmax, num_classes, frontend='dstft', batch_size=200,
                  freeze_base=False, device=None,
                  imagenet_pretrain=True, audioset_pretrain=False, model_size='base384',
-                 verbose=True):
+                 verbose=True, stft_engine='conv'):
         """
         Classifier using ASTModel as the backbone with selectable frontend feature extractors.
         
@@ -73,6 +69,7 @@ class AudioSpectrogramTransformer(nn.Module):
         :param audioset_pretrain: Use AudioSet pretraining for ASTModel.
         :param model_size: Size of the ASTModel ('tiny224', 'small224', 'base224', 'base384').
         :param verbose: Whether to print model summaries.
+        :param stft_engine: 'conv' (torchlibrosa) or 'fft' spectrogram/log-mel extractors.
         """
         super(AudioSpectrogramTransformer, self).__init__()
         self.frontend = frontend
@@ -94,81 +91,22 @@ class AudioSpectrogramTransformer(nn.Module):
         self.fmin = fmin
         self.fmax = fmax
 
-        # Initialize frontends
-        self.spectrogram_extractor = Spectrogram(n_fft=window_size, hop_length=hop_size, 
-                                                win_length=window_size, window=window, center=center, 
-                                                pad_mode=pad_mode, freeze_parameters=True)
-
-        self.logmel_extractor = LogmelFilterBank(sr=sample_rate, n_fft=window_size, 
-                                                 n_mels=mel_bins, fmin=fmin, fmax=fmax, ref=ref, 
-                                                 amin=amin, top_db=top_db, freeze_parameters=True)
+        # Initialize frontends (torchlibrosa conv DFT or FFT engine)
+        self.spectrogram_extractor, self.logmel_extractor = build_logmel_extractors(
+            stft_engine, sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+            mel_bins=mel_bins, fmin=fmin, fmax=fmax, window=window, center=center,
+            pad_mode=pad_mode, ref=ref, amin=amin, top_db=top_db)
 
         # Spec augmenter
         self.spec_augmenter = SpecAugmentation(time_drop_width=64, time_stripes_num=2, 
                                                freq_drop_width=8, freq_stripes_num=2)
 
-        self.mfcc_extractor = torchaudio.transforms.MFCC(
-            sample_rate=sample_rate,
-            n_mfcc=mel_bins,  # Number of MFCC coefficients
-            melkwargs={
-                "n_fft": window_size,
-                "n_mels": mel_bins,
-                "hop_length": hop_size,
-                "f_min": fmin,
-                "f_max": fmax,
-                "center": center,
-                "pad_mode": pad_mode
-            }
-        )
-
-        self.leaf_extractor = Leaf(
-            n_filters=40,
-            sample_rate=sample_rate,
-            window_len=16,
-            window_stride=8,
-            init_min_freq=50.0,
-            init_max_freq=sample_rate // 2,
-        )
-
-        self.diffres_extractor = DiffRes(
-            in_t_dim=int((sample_rate / hop_size) * 2) + 1,  # Adjust based on input dimensions
-            in_f_dim=mel_bins,
-            dimension_reduction_rate=0.60,
-            learn_pos_emb=False
-        )
-
-        self.dmel_extractor = DMel(
-            init_lambd=5.0, 
-            n_fft=window_size, 
-            win_length=window_size, 
-            hop_length=hop_size
-        )
-
-        self.dstft_extractor = DSTFT(
-            x=torch.randn(batch_size, sample_rate*2).to(self.device),
-            win_length=window_size,
-            support=window_size,
-            stride=hop_size,
-            pow=2,
-            win_pow=2,
-            win_requires_grad=True,
-            stride_requires_grad=True,
-            pow_requires_grad=False,    
-            win_p="t",
-            win_min=window_size//2,              
-            win_max=window_size,            
-            stride_min=hop_size//2,          
-            stride_max=hop_size,           
-            sr=sample_rate,
-        )
-
-        self.sincnet_extractor = SincNet(
-            out_channels=mel_bins, 
-            sample_rate=sample_rate, 
-            kernel_size=hop_size, 
-            window_size=window_size, 
-            hop_size=hop_size, 
-        )
+        # Build only the extractors of the selected frontend
+        extractors = build_frontend_extractors(
+            frontend, sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+            mel_bins=mel_bins, fmin=fmin, fmax=fmax, batch_size=batch_size, device=self.device)
+        for name, extractor in extractors.items():
+            setattr(self, name, extractor)
 
         # Initialize ASTModel backbone
         if self.frontend == 'diffres':
@@ -202,12 +140,23 @@ class AudioSpectrogramTransformer(nn.Module):
     def init_weight(self):
         init_bn(self.bn)
 
+    def extract_logmel(self, input):
+        """
+        Log-mel features of the default frontend.
+
+        :param input: Tensor of shape (batch_size, data_length)
+        :return: Tensor of shape (batch_size, 1, time_steps, mel_bins)
+        """
+        x = self.spectrogram_extractor(input)
+        return self.logmel_extractor(x)
+
     # @autocast()
-    def forward(self, input):
+    def forward(self, input, logmel=None):
         """
         Forward pass of the model.
         
         :param input: Tensor of shape (batch_size, data_length)
+        :param logmel: Optional cached output of extract_logmel, used instead of the extractors
         :return: Dictionary with outputs
         """
 
@@ -274,8 +223,11 @@ class AudioSpectrogramTransformer(nn.Module):
                 x = self.spec_augmenter(x)
 
         else: # for log-mel spectrogram
-            x = self.spectrogram_extractor(input)  # (batch, 1, time_steps, freq_bins)
-            x = self.logmel_extractor(x)  # (batch, 1, time_steps, mel_bins)
+            if logmel is None:
+                x = self.spectrogram_extractor(input)  # (batch, 1, time_steps, freq_bins)
+                x = self.logmel_extractor(x)  # (batch, 1, time_steps, mel_bins)
+            else:
+                x = logmel
             x = x.transpose(1, 3)  # Align dimensions for the base model
             x = self.bn(x)   # Apply the batch normalization from base
             x = x.transpose(1, 3)
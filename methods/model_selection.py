@@ -1,11 +1,20 @@
 # File: models/model_selection.py
 
+import os
+import types
+import functools
+
 import torch
+from torch.utils.checkpoint import checkpoint, set_checkpoint_early_stop
 from methods.panns.template import PANNS_CNN6, PANNS_RESNET22, PANNS_MOBILENETV1, PANNS_WAVEGRAM_CNN14
 from methods.hugging_face.models import CNN8RNN
 from methods.ast.template import AudioSpectrogramTransformer
+from methods.ast.models import ASTModel
+from methods.panns.models import ConvBlock, ConvBlock5x5, _ResnetBasicBlock, _ResnetBottleneck, MobileNetV1
+from frontends.frontend_registry import frontend_modules
 
-def get_model(args):
+def get_model(args, pretrained=True):
+    """Model selected by --model_name; pretrained=False skips loading the pretrained checkpoints."""
     if args.model_name == 'panns_cnn6':
         model = PANNS_CNN6(
             sample_rate=args.sample_rate, 
@@ -17,8 +26,10 @@ def get_model(args):
             num_classes=args.num_classes,
             frontend=args.frontend,
             batch_size=args.batch_size,
+            stft_engine=args.stft_engine,
         )
-        model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/Cnn6_mAP=0.343.pth")
+        if pretrained:
+            model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/Cnn6_mAP=0.343.pth")
     elif args.model_name == 'panns_resnet22':
         model = PANNS_RESNET22(
             sample_rate=args.sample_rate, 
@@ -27,9 +38,11 @@ def get_model(args):
             mel_bins=args.mel_bins, 
             fmin=args.fmin, 
             fmax=args.fmax, 
-            num_classes=args.num_classes
+            num_classes=args.num_classes,
+            stft_engine=args.stft_engine
         )
-        model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/ResNet22_mAP=0.430.pth") 
+        if pretrained:
+            model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/ResNet22_mAP=0.430.pth") 
     elif args.model_name == 'panns_mobilenetv1':
         model = PANNS_MOBILENETV1(
             sample_rate=args.sample_rate, 
@@ -38,9 +51,11 @@ def get_model(args):
             mel_bins=args.mel_bins, 
             fmin=args.fmin, 
             fmax=args.fmax, 
-            num_classes=args.num_classes
+            num_classes=args.num_classes,
+            stft_engine=args.stft_engine
         )
-        model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/MobileNetV1_mAP=0.389.pth") 
+        if pretrained:
+            model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/MobileNetV1_mAP=0.389.pth") 
     elif args.model_name == 'panns_wavegram_cnn14':
         model = PANNS_WAVEGRAM_CNN14(
             sample_rate=args.sample_rate, 
@@ -51,7 +66,8 @@ def get_model(args):
             fmax=args.fmax, 
             num_classes=args.num_classes
         )
-        model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/Wavegram_Cnn14_mAP=0.389.pth") 
+        if pretrained:
+            model.load_from_pretrain("/scratch/project_465001389/chandler_scratch/Projects/UWAC/weights/Wavegram_Cnn14_mAP=0.389.pth") 
     elif args.model_name == 'cnn8rnn':
         model = CNN8RNN(
             num_classes=args.num_classes
@@ -69,9 +85,10 @@ def get_model(args):
             batch_size=args.batch_size,
             freeze_base=False,
             device=None,
-            imagenet_pretrain=True,
-            audioset_pretrain=True,
+            imagenet_pretrain=pretrained,
+            audioset_pretrain=pretrained,
             model_size='base384',
+            stft_engine=args.stft_engine,
         )
     else: 
         raise ValueError(f"Unknown model name: {args.model_name}")
@@ -79,3 +96,91 @@ def get_model(args):
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     model.to(device)
     return model
+
+def compile_model(model, mode, cache_dir=None):
+    """
+    torch.compile the whole model ('model') or only its frontend modules
+    ('frontend'), in place: attributes and state dict keys are unchanged.
+
+    cache_dir: persistent Inductor cache (compiled graphs and autograd
+        artefacts), so later runs with the same shapes skip code generation
+    """
+    if mode == 'none':
+        return model
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        os.environ['TORCHINDUCTOR_CACHE_DIR'] = cache_dir
+    torch._inductor.config.fx_graph_cache = True
+    torch._functorch.config.enable_autograd_cache = True
+
+    if mode == 'model':
+        model.compile()
+    elif mode == 'frontend':
+        for module in frontend_modules(model):
+            module.compile()
+    else:
+        raise ValueError(f"Unknown compile mode: {mode}")
+    return model
+
+
+def checkpoint_blocks(model):
+    """Blocks whose activations can be recomputed: PANNs conv blocks, ResNet blocks and
+    MobileNetV1 feature stages, and the transformer blocks of AST's self.v.blocks."""
+    blocks = []
+    for module in model.modules():
+        if isinstance(module, (ConvBlock, ConvBlock5x5, _ResnetBasicBlock, _ResnetBottleneck)):
+            blocks.append(module)
+        elif isinstance(module, MobileNetV1):
+            blocks.extend(module.features)
+        elif isinstance(module, ASTModel):
+            blocks.extend(module.v.blocks)
+    return blocks
+
+
+def checkpointed_forward(self, *args, **kwargs):
+    """
+    The block's forward under torch.utils.checkpoint: only its input is kept
+    for backward and its activations are recomputed there. The recomputation
+    restores the BatchNorm running statistics it updates, so they still
+    advance once per forward pass. Without gradients the plain forward runs.
+    Bound to a block as its forward by enable_activation_checkpointing.
+    """
+    forward = functools.partial(type(self).forward, self)
+    if not torch.is_grad_enabled():
+        return forward(*args, **kwargs)
+
+    norms = [m for m in self.modules() if isinstance(m, torch.nn.modules.batchnorm._BatchNorm)]
+    calls = []
+
+    def function(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == 1:
+            return forward(*args, **kwargs)
+        # Recomputation in backward
+        buffers = [b.clone() for m in norms for b in m.buffers()]
+        output = forward(*args, **kwargs)
+        with torch.no_grad():
+            for b, saved in zip([b for m in norms for b in m.buffers()], buffers):
+                b.copy_(saved)
+        return output
+
+    # Recompute the whole block, so the running statistics are always restored
+    with set_checkpoint_early_stop(False):
+        return checkpoint(function, *args, use_reentrant=False, **kwargs)
+
+
+def enable_activation_checkpointing(model, every=1):
+    """
+    Checkpoint every `every`-th block of checkpoint_blocks(model) (0: none), trading
+    a second forward pass of those blocks for their activation memory.
+
+    Returns:
+        the number of checkpointed blocks
+    """
+    if every <= 0:
+        return 0
+    blocks = checkpoint_blocks(model)[::every]
+    for block in blocks:
+        block.forward = types.MethodType(checkpointed_forward, block)
+    return len(blocks)
+
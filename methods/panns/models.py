@@ -2,9 +2,8 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torchlibrosa.stft import Spectrogram, LogmelFilterBank
-from torchlibrosa.augmentation import SpecAugmentation
 
-from methods.panns.pytorch_utils import do_mixup, interpolate, pad_framewise_output
+from methods.panns.pytorch_utils import do_mixup, interpolate, pad_framewise_output, SpecAugmentation
  
 
 def init_layer(layer):
@@ -440,12 +439,16 @@ class Cnn6(nn.Module):
         init_layer(self.fc1)
         init_layer(self.fc_audioset)
  
-    def forward(self, input, mixup_lambda=None):
+    def forward(self, input, mixup_lambda=None, logmel=None):
         """
-        Input: (batch_size, data_length)"""
+        Input: (batch_size, data_length)
+        logmel: optional precomputed (batch_size, 1, time_steps, mel_bins) features"""
 
-        x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
-        x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
+        if logmel is None:
+            x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
+            x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
+        else:
+            x = logmel
         
         x = x.transpose(1, 3)
         x = self.bn0(x)
@@ -815,12 +818,16 @@ class ResNet22(nn.Module):
         init_layer(self.fc_audioset)
 
 
-    def forward(self, input, mixup_lambda=None):
+    def forward(self, input, mixup_lambda=None, logmel=None):
         """
-        Input: (batch_size, data_length)"""
+        Input: (batch_size, data_length)
+        logmel: optional precomputed (batch_size, 1, time_steps, mel_bins) features"""
 
-        x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
-        x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
+        if logmel is None:
+            x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
+            x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
+        else:
+            x = logmel
         
         x = x.transpose(1, 3)
         x = self.bn0(x)
@@ -1386,12 +1393,16 @@ class MobileNetV1(nn.Module):
         init_layer(self.fc1)
         init_layer(self.fc_audioset)
  
-    def forward(self, input, mixup_lambda=None):
+    def forward(self, input, mixup_lambda=None, logmel=None):
         """
-        Input: (batch_size, data_length)"""
+        Input: (batch_size, data_length)
+        logmel: optional precomputed (batch_size, 1, time_steps, mel_bins) features"""
 
-        x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
-        x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
+        if logmel is None:
+            x = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
+            x = self.logmel_extractor(x)    # (batch_size, 1, time_steps, mel_bins)
+        else:
+            x = logmel
         
         x = x.transpose(1, 3)
         x = self.bn0(x)
@@ -37,6 +37,78 @@ def do_mixup(x, mixup_lambda):
     return out
     
 
+class DropStripes(nn.Module):
+    def __init__(self, dim, drop_width, stripes_num):
+        """Drop stripes, as torchlibrosa.augmentation.DropStripes, with one
+        mask for the whole batch instead of a Python loop over examples and
+        stripes. Stripe widths and positions follow the same distributions,
+        no tensor value is read back to the host, so the module traces into a
+        single torch.compile graph.
+
+        Args:
+          dim: int, dimension along which to drop
+          drop_width: int, maximum width of stripes to drop
+          stripes_num: int, how many stripes to drop
+        """
+        super(DropStripes, self).__init__()
+
+        assert dim in [2, 3]    # dim 2: time; dim 3: frequency
+
+        self.dim = dim
+        self.drop_width = drop_width
+        self.stripes_num = stripes_num
+
+    def forward(self, input):
+        """input: (batch_size, channels, time_steps, freq_bins)"""
+
+        assert input.ndimension() == 4
+
+        if self.training is False:
+            return input
+
+        batch_size = input.shape[0]
+        total_width = input.shape[self.dim]
+        size = (batch_size, self.stripes_num, 1)
+
+        distance = torch.randint(low=0, high=self.drop_width, size=size, device=input.device)
+        bgn = (torch.rand(size, device=input.device) * (total_width - distance)).long()
+        position = torch.arange(total_width, device=input.device)
+        dropped = ((position >= bgn) & (position < bgn + distance)).any(dim=1)
+
+        if self.dim == 2:
+            dropped = dropped[:, None, :, None]
+        else:
+            dropped = dropped[:, None, None, :]
+        return input.masked_fill(dropped, 0)
+
+
+class SpecAugmentation(nn.Module):
+    def __init__(self, time_drop_width, time_stripes_num, freq_drop_width,
+        freq_stripes_num):
+        """Spec augmentation with batched DropStripes, a drop-in replacement
+        for torchlibrosa.augmentation.SpecAugmentation.
+
+        Args:
+          time_drop_width: int
+          time_stripes_num: int
+          freq_drop_width: int
+          freq_stripes_num: int
+        """
+
+        super(SpecAugmentation, self).__init__()
+
+        self.time_dropper = DropStripes(dim=2, drop_width=time_drop_width,
+            stripes_num=time_stripes_num)
+
+        self.freq_dropper = DropStripes(dim=3, drop_width=freq_drop_width,
+            stripes_num=freq_stripes_num)
+
+    def forward(self, input):
+        x = self.time_dropper(input)
+        x = self.freq_dropper(x)
+        return x
+
+
 def append_to_dict(dict, key, value):
     if key in dict.keys():
         dict[key].append(value)
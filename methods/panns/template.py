@@ -1,5 +1,6 @@
 import os
 import sys
+import copy
 # sys.path.insert(1, os.path.join(sys.path[0], '../utils'))
 import numpy as np
 import argparse
@@ -18,20 +19,87 @@ import torch.optim as optim
 import torch.utils.data
 
 import torchaudio
-import librosa
 
 from methods.panns.pytorch_utils import *
 from methods.panns.models import *
-from frontends.leaf.frontend import Leaf
-from frontends.dmel.frontend import DMel
-from frontends.dstft.frontend import DSTFT
-from frontends.sincnet.frontend import SincNet
-from frontends.diffres.frontend import DiffRes
+from frontends.frontend_registry import build_frontend_extractors
+from frontends.fft_spectrogram import build_logmel_extractors
+
+class ChannelAffine(nn.Module):
+    def __init__(self, bn):
+        """An eval-mode BatchNorm2d folded into a per-channel scale and shift."""
+        super(ChannelAffine, self).__init__()
+        scale, shift = _batchnorm_scale_shift(bn)
+        self.register_buffer('scale', scale.reshape(1, -1, 1, 1).to(bn.running_var.dtype))
+        self.register_buffer('shift', shift.reshape(1, -1, 1, 1).to(bn.running_var.dtype))
+
+    def forward(self, x):
+        return torch.addcmul(self.shift, x, self.scale)
+
+
+def _batchnorm_scale_shift(bn):
+    """Scale and shift (float64) of an eval-mode BatchNorm: bn(x) = x * scale + shift per channel."""
+    scale = torch.rsqrt(bn.running_var.double() + bn.eps)
+    if bn.affine:
+        scale = scale * bn.weight.double()
+    shift = -bn.running_mean.double() * scale
+    if bn.affine:
+        shift = shift + bn.bias.double()
+    return scale, shift
+
+
+def _fold_conv_bn(conv, bn):
+    """Fold an eval-mode BatchNorm following conv into the conv's weight and bias (in float64)."""
+    scale, shift = _batchnorm_scale_shift(bn)
+    weight = conv.weight.double() * scale.reshape(-1, *[1] * (conv.weight.dim() - 1))
+    bias = shift if conv.bias is None else conv.bias.double() * scale + shift
+    conv.weight = nn.Parameter(weight.to(conv.weight.dtype), requires_grad=False)
+    conv.bias = nn.Parameter(bias.to(conv.weight.dtype), requires_grad=False)
+
+
+def optimize_panns_for_inference(model):
+    """
+    Inference form of a PANNs template (see PANNS_CNN6.optimize_for_inference).
+
+    Returns:
+        model, in eval mode, modified in place
+    """
+    model.eval()
+    with torch.no_grad():
+        for module in list(model.modules()):
+            # convN followed by bnN: ConvBlock, ConvBlock5x5 and the ResNet blocks
+            for i in range(1, 4):
+                conv, bn = getattr(module, f'conv{i}', None), getattr(module, f'bn{i}', None)
+                if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                    _fold_conv_bn(conv, bn)
+                    setattr(module, f'bn{i}', nn.Identity())
+            # Conv2d [AvgPool2d] BatchNorm2d in a Sequential: ResNet downsampling and MobileNetV1
+            # stages (average pooling is linear and per channel, so the BatchNorm commutes with it)
+            if isinstance(module, nn.Sequential):
+                for j, bn in enumerate(module):
+                    k = j - 1
+                    while k >= 0 and isinstance(module[k], nn.AvgPool2d) and module[k].padding == 0:
+                        k -= 1
+                    if isinstance(bn, nn.BatchNorm2d) and k >= 0 and isinstance(module[k], nn.Conv2d):
+                        _fold_conv_bn(module[k], bn)
+                        module[j] = nn.Identity()
+        # BatchNorms without a preceding conv (bn0 over the mel bins, bn0_ens) become an affine
+        # op: the first conv zero-pads its input, so bn0 cannot be folded into it exactly
+        for module in list(model.modules()):
+            for name, child in module.named_children():
+                if isinstance(child, nn.BatchNorm2d):
+                    setattr(module, name, ChannelAffine(child))
+                elif isinstance(child, nn.Dropout):
+                    setattr(module, name, nn.Identity())
+
+    model.to(memory_format=torch.channels_last)
+    return model
+
 
 class PANNS_CNN6(nn.Module):
     def __init__(self, sample_rate, window_size, hop_size, mel_bins, fmin, 
                  fmax, num_classes, frontend='logmel', batch_size=200,
-                 freeze_base=False, device=None,
+                 freeze_base=False, device=None, stft_engine='conv',
                  ):
         """Classifier for a new task using pretrained Cnn6 as a sub-module."""
         super(PANNS_CNN6, self).__init__()
@@ -58,81 +126,21 @@ class PANNS_CNN6(nn.Module):
                          fmax, audioset_classes_num)
 
         # Step 2: Optionally store the custom modules (but do not apply them yet)
-        # Spectrogram extractor
-        self.spectrogram_extractor = Spectrogram(n_fft=window_size, hop_length=hop_size, 
-            win_length=window_size, window=window, center=center, pad_mode=pad_mode, 
-            freeze_parameters=True)
-
-        # Logmel feature extractor
-        self.logmel_extractor = LogmelFilterBank(sr=sample_rate, n_fft=window_size, 
-            n_mels=mel_bins, fmin=fmin, fmax=fmax, ref=ref, amin=amin, top_db=top_db, 
-            freeze_parameters=True)
+        # Spectrogram and logmel feature extractors (torchlibrosa conv DFT or FFT engine)
+        self.spectrogram_extractor, self.logmel_extractor = build_logmel_extractors(
+            stft_engine, sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+            mel_bins=mel_bins, fmin=fmin, fmax=fmax, window=window, center=center,
+            pad_mode=pad_mode, ref=ref, amin=amin, top_db=top_db)
             
-        # MFCC feature extractor
-        self.mfcc_extractor = torchaudio.transforms.MFCC(
-            sample_rate=sample_rate,
-            n_mfcc=mel_bins,  # This determines the number of MFCC coefficients
-            melkwargs={
-                "n_fft": window_size,
-                "n_mels": mel_bins,
-                "hop_length": hop_size,
-                "f_min": fmin,
-                "f_max": fmax,
-                "center": center,
-                "pad_mode": pad_mode
-            }
-        )
-
-        self.leaf_extractor = Leaf(
-            n_filters = 40,
-            sample_rate = sample_rate,
-            window_len = 16,
-            window_stride = 8,
-            init_min_freq = 50.0,
-            init_max_freq = sample_rate // 2,
-        )
-
-        self.diffres_extractor = DiffRes(
-            in_t_dim=251,
-            in_f_dim=mel_bins,
-            dimension_reduction_rate=0.60,
-            learn_pos_emb=False
-        )
-
-        self.dmel_extractor = DMel(
-            init_lambd=5.0, 
-            n_fft=window_size, 
-            win_length=window_size, 
-            hop_length=hop_size
-            )
-
-        self.dstft_extractor = DSTFT(
-            x=torch.randn(batch_size, sample_rate*2).to('cuda'),
-            win_length=window_size,
-            support=window_size,
-            stride=hop_size,
-            pow=2,
-            win_pow=2,
-            win_requires_grad=True,
-            stride_requires_grad=True,
-            pow_requires_grad=False,    
-            win_p="t",
-            win_min=window_size//2,              
-            win_max=window_size,            
-            stride_min=hop_size//2,          
-            stride_max=hop_size,           
-            sr=sample_rate,
-            )
-
-        self.sincnet_extractor = SincNet(
-            out_channels=mel_bins, 
-            sample_rate=sample_rate, 
-            kernel_size=hop_size, 
-            window_size=window_size, 
-            hop_size=hop_size, 
-            )
-
-        self.bn0_ens = nn.BatchNorm2d(mel_bins*3)
+        # Build only the extractors of the selected frontend
+        extractors = build_frontend_extractors(
+            frontend, sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+            mel_bins=mel_bins, fmin=fmin, fmax=fmax, batch_size=batch_size, device=device)
+        for name, extractor in extractors.items():
+            setattr(self, name, extractor)
+
+        if frontend == 'ensemble':
+            self.bn0_ens = nn.BatchNorm2d(mel_bins*3)
         # Transfer to another task layer
         self.fc_transfer = nn.Linear(512, num_classes, bias=True)  # Assuming 512 is embedding size
         
@@ -185,8 +193,25 @@ class PANNS_CNN6(nn.Module):
         # Load the updated model_dict
         model.load_state_dict(model_dict)
 
-    def forward(self, input, mixup_lambda=None):
-        """Input: (batch_size, data_length)"""
+    def optimize_for_inference(self):
+        """
+        Inference-only form of the model, in place: eval mode, every BatchNorm
+        folded into the preceding conv's weights (bn0 into a per-mel-bin
+        scale and shift), dropout modules removed and 4D weights in
+        channels_last for the oneDNN CPU kernels. Outputs match eval mode up
+        to float rounding. Load checkpoints before calling: the folded model's
+        state dict has no BatchNorm entries. Returns self.
+        """
+        return optimize_panns_for_inference(self)
+
+    def extract_logmel(self, input):
+        """Log-mel features of the 'logmel' frontend: (batch_size, 1, time_steps, mel_bins)"""
+        x = self.base.spectrogram_extractor(input)
+        return self.base.logmel_extractor(x)
+
+    def forward(self, input, mixup_lambda=None, logmel=None):
+        """Input: (batch_size, data_length)
+        logmel: optional cached output of extract_logmel, used instead of the extractors"""
         
         if self.frontend == 'mfcc':
             # If MFCC is chosen, extract MFCC features
@@ -202,17 +227,9 @@ class PANNS_CNN6(nn.Module):
                 x = self.base.spec_augmenter(x)
 
         elif self.frontend == 'chroma':
-            # Extract chroma features using librosa's chroma_stft function
-            input_np = input.cpu().numpy()  # Convert to NumPy for librosa
-            chroma_features = []
-            for i in range(input_np.shape[0]):  # Loop over batch
-                chroma = librosa.feature.chroma_stft(y=input_np[i], sr=self.sample_rate, n_fft=self.window_size, 
-                                                     hop_length=self.hop_size, win_length=self.window_size, 
-                                                     window='hann', n_chroma=self.mel_bins, tuning=0)
-                chroma_features.append(chroma)
-            chroma_features = np.stack(chroma_features, axis=0)  # Shape: (batch_size, n_chroma, time_steps)
-            x = torch.tensor(chroma_features, dtype=torch.float32, device=input.device)  # Convert back to tensor
-            x = x.unsqueeze(1).transpose(2, 3)  # Shape: (batch_size, 1, n_chroma, time_steps)
+            # Chroma features, batched on the input's device (matches librosa's chroma_stft)
+            x = self.chroma_extractor(input)  # Shape: (batch_size, n_chroma, time_steps)
+            x = x.unsqueeze(1).transpose(2, 3)  # Shape: (batch_size, 1, time_steps, n_chroma)
 
             # Pass the precomputed features (MFCC or LogMel) into the base model conv blocks
             x = x.transpose(1, 3)  # Align dimensions for the base model
@@ -223,25 +240,8 @@ class PANNS_CNN6(nn.Module):
                 x = self.base.spec_augmenter(x)
 
         elif self.frontend == 'ensemble':
-            # If MFCC is chosen, extract MFCC features
-            x1 = self.mfcc_extractor(input)
-            x1 = x1.unsqueeze(1).transpose(2, 3)  # Shape: (batch_size, 1, time_steps, n_mfcc)
-
-            # Extract chroma features using librosa's chroma_stft function
-            input_np = input.cpu().numpy()  # Convert to NumPy for librosa
-            chroma_features = []
-            for i in range(input_np.shape[0]):  # Loop over batch
-                chroma = librosa.feature.chroma_stft(y=input_np[i], sr=self.sample_rate, n_fft=self.window_size, 
-                                                    hop_length=self.hop_size, win_length=self.window_size, 
-                                                    window='hann', n_chroma=self.mel_bins, tuning=0)
-                chroma_features.append(chroma)
-            chroma_features = np.stack(chroma_features, axis=0)  # Shape: (batch_size, n_chroma, time_steps)
-            x2 = torch.tensor(chroma_features, dtype=torch.float32, device=input.device)  # Convert back to tensor
-            x2 = x2.unsqueeze(1).transpose(2, 3)  # Shape: (batch_size, 1, time_steps, n_chroma)
-
-            # Extract LogMel features
-            x3 = self.spectrogram_extractor(input)   # (batch_size, 1, time_steps, freq_bins)
-            x3 = self.logmel_extractor(x3)  # (batch_size, 1, time_steps, mel_bins)
+            # MFCC, chroma and LogMel features from one shared power spectrogram
+            x1, x2, x3 = self.ensemble_extractor(input)  # each (batch_size, 1, time_steps, bins)
 
             x = torch.cat((x1, x2, x3), dim=3) 
 
@@ -344,7 +344,7 @@ class PANNS_CNN6(nn.Module):
                 x = self.base.spec_augmenter(x)
 
         else:
-            output_dict = self.base(input, mixup_lambda)
+            output_dict = self.base(input, mixup_lambda, logmel=logmel)
             embedding = output_dict['embedding']
 
             clipwise_output = self.fc_transfer(embedding)
@@ -390,7 +390,7 @@ class PANNS_CNN6(nn.Module):
 
 class PANNS_RESNET22(nn.Module):
     def __init__(self, sample_rate, window_size, hop_size, mel_bins, fmin, 
-                 fmax, num_classes, freeze_base=False
+                 fmax, num_classes, freeze_base=False, stft_engine='conv'
                  ):
         """Classifier for a new task using pretrained Cnn6 as a sub-module."""
         super(PANNS_RESNET22, self).__init__()
@@ -408,15 +408,11 @@ class PANNS_RESNET22(nn.Module):
                          fmax, audioset_classes_num)
 
         # Step 2: Optionally store the custom modules (but do not apply them yet)
-        # Spectrogram extractor
-        self.spectrogram_extractor = Spectrogram(n_fft=window_size, hop_length=hop_size, 
-            win_length=window_size, window=window, center=center, pad_mode=pad_mode, 
-            freeze_parameters=True)
-
-        # Logmel feature extractor
-        self.logmel_extractor = LogmelFilterBank(sr=sample_rate, n_fft=window_size, 
-            n_mels=mel_bins, fmin=fmin, fmax=fmax, ref=ref, amin=amin, top_db=top_db, 
-            freeze_parameters=True)
+        # Spectrogram and logmel feature extractors (torchlibrosa conv DFT or FFT engine)
+        self.spectrogram_extractor, self.logmel_extractor = build_logmel_extractors(
+            stft_engine, sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+            mel_bins=mel_bins, fmin=fmin, fmax=fmax, window=window, center=center,
+            pad_mode=pad_mode, ref=ref, amin=amin, top_db=top_db)
 
         # Transfer to another task layer
         self.fc_transfer = nn.Linear(2048, num_classes, bias=True)  # Assuming 512 is embedding size
@@ -470,9 +466,26 @@ class PANNS_RESNET22(nn.Module):
         # Load the updated model_dict
         model.load_state_dict(model_dict)
 
-    def forward(self, input, mixup_lambda=None):
-        """Input: (batch_size, data_length)"""
-        output_dict = self.base(input, mixup_lambda)
+    def optimize_for_inference(self):
+        """
+        Inference-only form of the model, in place: eval mode, every BatchNorm
+        folded into the preceding conv's weights (bn0 into a per-mel-bin
+        scale and shift), dropout modules removed and 4D weights in
+        channels_last for the oneDNN CPU kernels. Outputs match eval mode up
+        to float rounding. Load checkpoints before calling: the folded model's
+        state dict has no BatchNorm entries. Returns self.
+        """
+        return optimize_panns_for_inference(self)
+
+    def extract_logmel(self, input):
+        """Log-mel features: (batch_size, 1, time_steps, mel_bins)"""
+        x = self.base.spectrogram_extractor(input)
+        return self.base.logmel_extractor(x)
+
+    def forward(self, input, mixup_lambda=None, logmel=None):
+        """Input: (batch_size, data_length)
+        logmel: optional cached output of extract_logmel, used instead of the extractors"""
+        output_dict = self.base(input, mixup_lambda, logmel=logmel)
         embedding = output_dict['embedding']
 
         clipwise_output = self.fc_transfer(embedding)
@@ -482,7 +495,7 @@ class PANNS_RESNET22(nn.Module):
 
 class PANNS_MOBILENETV1(nn.Module):
     def __init__(self, sample_rate, window_size, hop_size, mel_bins, fmin, 
-                 fmax, num_classes, freeze_base=False
+                 fmax, num_classes, freeze_base=False, stft_engine='conv'
                  ):
         """Classifier for a new task using pretrained Cnn6 as a sub-module."""
         super(PANNS_MOBILENETV1, self).__init__()
@@ -500,15 +513,11 @@ class PANNS_MOBILENETV1(nn.Module):
                          fmax, audioset_classes_num)
 
         # Step 2: Optionally store the custom modules (but do not apply them yet)
-        # Spectrogram extractor
-        self.spectrogram_extractor = Spectrogram(n_fft=window_size, hop_length=hop_size, 
-            win_length=window_size, window=window, center=center, pad_mode=pad_mode, 
-            freeze_parameters=True)
-
-        # Logmel feature extractor
-        self.logmel_extractor = LogmelFilterBank(sr=sample_rate, n_fft=window_size, 
-            n_mels=mel_bins, fmin=fmin, fmax=fmax, ref=ref, amin=amin, top_db=top_db, 
-            freeze_parameters=True)
+        # Spectrogram and logmel feature extractors (torchlibrosa conv DFT or FFT engine)
+        self.spectrogram_extractor, self.logmel_extractor = build_logmel_extractors(
+            stft_engine, sample_rate=sample_rate, window_size=window_size, hop_size=hop_size,
+            mel_bins=mel_bins, fmin=fmin, fmax=fmax, window=window, center=center,
+            pad_mode=pad_mode, ref=ref, amin=amin, top_db=top_db)
 
         # Transfer to another task layer
         self.fc_transfer = nn.Linear(1024, num_classes, bias=True)  # Assuming 512 is embedding size
@@ -562,9 +571,26 @@ class PANNS_MOBILENETV1(nn.Module):
         # Load the updated model_dict
         model.load_state_dict(model_dict)
         
-    def forward(self, input, mixup_lambda=None):
-        """Input: (batch_size, data_length)"""
-        output_dict = self.base(input, mixup_lambda)
+    def optimize_for_inference(self):
+        """
+        Inference-only form of the model, in place: eval mode, every BatchNorm
+        folded into the preceding conv's weights (bn0 into a per-mel-bin
+        scale and shift), dropout modules removed and 4D weights in
+        channels_last for the oneDNN CPU kernels. Outputs match eval mode up
+        to float rounding. Load checkpoints before calling: the folded model's
+        state dict has no BatchNorm entries. Returns self.
+        """
+        return optimize_panns_for_inference(self)
+
+    def extract_logmel(self, input):
+        """Log-mel features: (batch_size, 1, time_steps, mel_bins)"""
+        x = self.base.spectrogram_extractor(input)
+        return self.base.logmel_extractor(x)
+
+    def forward(self, input, mixup_lambda=None, logmel=None):
+        """Input: (batch_size, data_length)
+        logmel: optional cached output of extract_logmel, used instead of the extractors"""
+        output_dict = self.base(input, mixup_lambda, logmel=logmel)
         embedding = output_dict['embedding']
 
         clipwise_output = self.fc_transfer(embedding)
@@ -690,5 +716,16 @@ def main():
     print(f"Clipwise output shape: {clipwise_output.shape}")  # Expected: (batch_size, classes_num)
     print(f"Embedding shape: {embedding.shape}")  # Expected: (batch_size, embedding_size)
 
+    # Folded, channels_last inference form against eval mode
+    optimized = copy.deepcopy(model).optimize_for_inference()
+    with torch.no_grad():
+        for name, m in [('eval', model), ('optimized', optimized)]:
+            m(dummy_input)
+            start = time.perf_counter()
+            outputs = m(dummy_input)
+            print(f"{name:>9}: {(time.perf_counter() - start) * 1000:8.1f} ms")
+    difference = (outputs['clipwise_output'] - clipwise_output).abs().max().item()
+    print(f"Max abs difference of optimize_for_inference: {difference:.2e}")
+
 if __name__ == "__main__":
     main()
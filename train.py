@@ -2,18 +2,20 @@
 
 import os
 import ssl
+import time
 import random
 import numpy as np
 import torch
 from torch.utils.data import DataLoader
 
 from config.config import parse_args
-from methods.model_selection import get_model
-from transforms.audio_transforms import get_transforms
+from methods.model_selection import get_model, compile_model, enable_activation_checkpointing
+from transforms.audio_transforms import get_transforms, get_batch_transforms
 from losses.loss_selection import get_loss_function
-from frontends.frontend_selection import process_outputs
+from frontends.frontend_selection import process_outputs, get_feature_cache, to_labels, get_autocast, get_grad_scaler, pad_batch, \
+    get_micro_batch_size, split_batch, configure_batchnorm, freeze_batchnorm
 from loggers.wandb_init import initialize_wandb
-from loggers.metrics_logging import log_metrics
+from loggers.metrics_logging import log_metrics, peak_memory_mib
 from loggers.ckpt_saving import save_checkpoint
 from datasets.dataset_selection import get_dataloaders
 
@@ -57,18 +59,37 @@ def main():
 
     # Initialize model
     model = get_model(args)
+    # Each batch of batch_size examples runs as micro-batches of micro_batch_size, one optimizer step per batch
+    micro_batch_size = get_micro_batch_size(args)
+    configure_batchnorm(model, args)
+    if args.activation_checkpointing:
+        blocks = enable_activation_checkpointing(model, args.activation_checkpointing)
+        print(f"Activation checkpointing: {blocks} blocks")
+    # Compiled graphs are specialized to the batch size: training micro-batches are always full
+    # (see get_micro_batch_size), short validation batches are padded to it
+    model = compile_model(model, args.compile, args.compile_cache_dir)
+    pad_last_batch = args.compile != 'none'
 
     # Get transforms
     transform = get_transforms(args)
+    batch_transform = get_batch_transforms(args)
 
     # Initialize data loaders using the new dataset_selection module
     train_dataset, train_loader, val_dataset, val_loader = get_dataloaders(args, transform)
 
+    # Log-mel features are deterministic for validation, and for training without waveform augmentation
+    feature_cache = get_feature_cache(args)
+    train_feature_cache = feature_cache if transform is None and batch_transform is None else None
+
     # Loss and optimizer
     criterion = get_loss_function(args)
     optimizer = torch.optim.Adam(model.parameters(), lr=args.learning_rate, betas=(0.9, 0.999), weight_decay=0)
     scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', patience=args.patience, factor=args.factor)
 
+    # Mixed precision: autocast around the forward passes, loss scaling for fp16
+    autocast = get_autocast(args, device)
+    scaler = get_grad_scaler(args, device)
+
     if args.lr_warmup:
         warmup_scheduler = torch.optim.lr_scheduler.LambdaLR(
             optimizer, 
@@ -81,27 +102,54 @@ def main():
     # Training loop
     for epoch in range(args.max_epoch):
         model.train()
+        if args.bn_mode == 'frozen':
+            freeze_batchnorm(model)
         running_loss = 0.0
         all_train_targets = []
         all_train_outputs = []
 
+        if device.type == 'cuda':
+            torch.cuda.reset_peak_memory_stats(device)
+        epoch_start = time.perf_counter()
+        train_samples = 0
+
         for batch in tqdm(train_loader, desc=f"Epoch {epoch+1}/{args.max_epoch} - Training"):
-            inputs = batch['waveform'].to(device)
-            targets = batch['target'].to(device)
+            inputs = batch['waveform'].to(device, non_blocking=True)
+            targets = batch['target'].to(device, non_blocking=True)
 
-            loss, outputs = process_outputs(model, args, inputs, targets, criterion)
+            if batch_transform is not None:
+                inputs = batch_transform(inputs)
+
+            features = None
+            if train_feature_cache is not None:
+                features = train_feature_cache(model, inputs, batch['audio_name'])
 
-            # Backward pass and optimization
             optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            for micro_inputs, micro_targets, micro_features in split_batch(
+                    micro_batch_size, inputs, targets, features):
+                with autocast():
+                    loss, outputs = process_outputs(model, args, micro_inputs, micro_targets, criterion,
+                                                    features=micro_features)
+
+                # Weight each micro-batch by its share of the batch: the accumulated
+                # gradient is the gradient of the full-batch mean loss
+                scaler.scale(loss * (outputs.size(0) / inputs.size(0))).backward()
+
+                # Accumulate loss
+                running_loss += loss.item() * outputs.size(0)
 
-            # Accumulate loss
-            running_loss += loss.item() * inputs.size(0)
+                # Store predictions and targets
+                all_train_targets.append(to_labels(micro_targets).cpu().numpy())
+                all_train_outputs.append(outputs.detach().float().cpu().numpy())
+
+            # One optimization step per batch
+            scaler.step(optimizer)
+            scaler.update()
+            train_samples += inputs.size(0)
 
-            # Store predictions and targets
-            all_train_targets.append(targets.argmax(dim=-1).cpu().numpy())
-            all_train_outputs.append(outputs.detach().cpu().numpy())
+        # Samples actually trained on: drop_last leaves out the short last batch
+        train_throughput = train_samples / (time.perf_counter() - epoch_start)
+        train_peak_memory = peak_memory_mib(device)
 
         # Compute training metrics
         all_train_targets = np.concatenate(all_train_targets, axis=0)
@@ -119,7 +167,9 @@ def main():
         print(f'Epoch [{epoch+1}/{args.max_epoch}], '
               f'Train Loss: {epoch_loss:.4f}, '
               f'Accuracy: {train_acc:.4f}, '
-              f'mAP: {train_map:.4f}')
+              f'mAP: {train_map:.4f}, '
+              f'Throughput ({args.precision}): {train_throughput:.1f} samples/s, '
+              f'Peak memory: {train_peak_memory:.0f} MiB')
 
         # Validation
         model.eval()
@@ -129,20 +179,39 @@ def main():
 
         with torch.no_grad():
             for batch in tqdm(val_loader, desc=f"Epoch {epoch+1}/{args.max_epoch} - Validation"):
-                inputs = batch['waveform'].to(device)
-                targets = batch['target'].to(device)
-
-                if any(keyword in args.model_name for keyword in ('panns', 'ast')):
-                    outputs = model(inputs)['clipwise_output']
-                else:
-                    outputs = model(inputs)
-
-                loss = criterion(outputs, targets.argmax(dim=-1))
-                val_loss += loss.item() * inputs.size(0)
-
-                # Store predictions and targets
-                all_val_targets.append(targets.argmax(dim=-1).cpu().numpy())
-                all_val_outputs.append(outputs.detach().cpu().numpy())
+                inputs = batch['waveform'].to(device, non_blocking=True)
+                targets = batch['target'].to(device, non_blocking=True)
+
+                features = None
+                if feature_cache is not None:
+                    features = feature_cache(model, inputs, batch['audio_name'])
+
+                # Validation batches also run in micro-batches, bounding activation memory
+                for micro_inputs, micro_targets, micro_features in split_batch(
+                        micro_batch_size, inputs, targets, features):
+                    n_valid = None
+                    if pad_last_batch:
+                        micro_inputs, micro_targets, micro_features, n_valid = pad_batch(
+                            micro_batch_size, micro_inputs, micro_targets, micro_features)
+                    with autocast():
+                        if feature_cache is not None:
+                            outputs = model(micro_inputs, logmel=micro_features)['clipwise_output']
+                        elif any(keyword in args.model_name for keyword in ('panns', 'ast')):
+                            outputs = model(micro_inputs)['clipwise_output']
+                        else:
+                            outputs = model(micro_inputs)
+                    outputs = outputs[:n_valid].float()
+                    micro_targets = micro_targets[:n_valid]
+
+                    loss = criterion(outputs, to_labels(micro_targets))
+                    val_loss += loss.item() * outputs.size(0)
+
+                    # Store predictions and targets
+                    all_val_targets.append(to_labels(micro_targets).cpu().numpy())
+                    all_val_outputs.append(outputs.detach().cpu().numpy())
+
+        if feature_cache is not None:
+            feature_cache.save()
 
         # Compute validation metrics
         val_loss /= len(val_loader.dataset)
@@ -171,7 +240,9 @@ def main():
             "Train mAP": train_map,
             "Validation Loss": val_loss,
             "Validation Accuracy": val_acc,
-            "Validation mAP": val_map
+            "Validation mAP": val_map,
+            "Train Throughput": train_throughput,
+            "Train Peak Memory (MiB)": train_peak_memory
         })
 
         # Save checkpoints
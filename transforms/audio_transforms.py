@@ -2,9 +2,11 @@
 
 import audiomentations
 
+from transforms.batch_transforms import BatchButterworthFilter
+
 def get_transforms(args):
     transform = None
-    if args.audiomentations:
+    if args.audiomentations and not args.batch_augment:
         if 'panns' in args.model_name:
             if args.freq_band == 'low':
                 transform = audiomentations.Compose([
@@ -14,7 +16,7 @@ def get_transforms(args):
                         min_rolloff=12,
                         max_rolloff=24,
                         zero_phase=False, 
-                        p=0.10
+                        p=args.filter_chance
                     ),
                 ])
             elif args.freq_band == 'mid':
@@ -27,7 +29,7 @@ def get_transforms(args):
                         min_rolloff=12,  
                         max_rolloff=24,  
                         zero_phase=False,  
-                        p=0.10  
+                        p=args.filter_chance
                     ),
                 ])
             elif args.freq_band == 'high':
@@ -38,7 +40,7 @@ def get_transforms(args):
                         min_rolloff=12,  
                         max_rolloff=24,  
                         zero_phase=False,  
-                        p=0.10  
+                        p=args.filter_chance
                     ),
                 ])
             else:
@@ -53,3 +55,46 @@ def get_transforms(args):
             #     audiomentations.Shift(p=0.5),
             # ])
     return transform
+
+
+def get_batch_transforms(args):
+    """
+    On-device counterpart of get_transforms, applied to the collated batch.
+
+    Uses the same filters, frequency ranges and per-example probability
+    (--filter_chance). Cutoffs refer to 2 * sample_rate, the rate the
+    per-sample transform is given in Fish_Voice_Dataset.
+    """
+    transform = None
+    if args.audiomentations and args.batch_augment and 'panns' in args.model_name:
+        sample_rate = 2 * args.sample_rate
+        if args.freq_band == 'low':
+            transform = BatchButterworthFilter(
+                'lowpass', sample_rate,
+                min_cutoff_freq=0.0,
+                max_cutoff_freq=12800.0,
+                min_rolloff=12,
+                max_rolloff=24,
+                p=args.filter_chance
+            )
+        elif args.freq_band == 'mid':
+            transform = BatchButterworthFilter(
+                'bandpass', sample_rate,
+                min_center_freq=12800.0,
+                max_center_freq=44800.0,
+                min_bandwidth_fraction=1.0,
+                max_bandwidth_fraction=1.2,
+                min_rolloff=12,
+                max_rolloff=24,
+                p=args.filter_chance
+            )
+        elif args.freq_band == 'high':
+            transform = BatchButterworthFilter(
+                'highpass', sample_rate,
+                min_cutoff_freq=44800.0,
+                max_cutoff_freq=64000.0,
+                min_rolloff=12,
+                max_rolloff=24,
+                p=args.filter_chance
+            )
+    return transform
@@ -0,0 +1,170 @@
+# File: transforms/batch_transforms.py
+
+import math
+
+import torch
+import torch.nn as nn
+
+
+def frequency_to_mel(f):
+    return 2595.0 * torch.log10(1.0 + f / 700.0)
+
+
+def mel_to_frequency(m):
+    return 700.0 * (10 ** (m / 2595.0) - 1.0)
+
+
+def butterworth_prototype_poles(order, max_order):
+    """
+    Normalised analog Butterworth poles, one row per example.
+
+    Slots beyond an example's order are returned as nan and masked by the caller.
+    """
+    k = torch.arange(1, max_order + 1, device=order.device, dtype=torch.float64)
+    n = order.to(torch.float64).unsqueeze(-1)
+    poles = torch.exp(1j * math.pi * (2 * k + n - 1) / (2 * n))
+    return torch.where(k <= n, poles, torch.full_like(poles, float('nan')))
+
+
+def bilinear(s, sample_rate):
+    return (2 * sample_rate + s) / (2 * sample_rate - s)
+
+
+def prewarp(freq, sample_rate):
+    return 2 * sample_rate * torch.tan(math.pi * freq / sample_rate)
+
+
+class BatchButterworthFilter(nn.Module):
+    """
+    Batched, on-device version of the audiomentations Butterworth filters.
+
+    Every example of the batch is filtered with probability ``p``, with its
+    own cutoff (sampled uniformly on the mel scale), bandwidth and roll-off,
+    following audiomentations' parameter sampling. The digital Butterworth
+    response is designed in torch from the analog prototype via the bilinear
+    transform and applied in the frequency domain (FFT of the zero-padded
+    clip), which matches causal IIR filtering with audiomentations'
+    steady-state initial conditions up to the response tail beyond one clip
+    length. Filter design and filtering run on the device of the batch.
+
+    params:
+        filter_type: 'lowpass', 'highpass' or 'bandpass'
+        sample_rate: sample rate the cutoff frequencies refer to
+        p: probability of filtering each example
+    """
+
+    def __init__(self, filter_type, sample_rate, p=0.5, min_rolloff=12, max_rolloff=24,
+                 min_cutoff_freq=None, max_cutoff_freq=None,
+                 min_center_freq=None, max_center_freq=None,
+                 min_bandwidth_fraction=None, max_bandwidth_fraction=None):
+        super(BatchButterworthFilter, self).__init__()
+        if filter_type not in ('lowpass', 'highpass', 'bandpass'):
+            raise ValueError(f"Unsupported filter type: {filter_type}")
+        if min_rolloff % 6 != 0 or max_rolloff % 6 != 0 or min_rolloff > max_rolloff:
+            raise ValueError("Roll-offs must be multiples of 6 dB/octave with min_rolloff <= max_rolloff")
+        self.filter_type = filter_type
+        self.sample_rate = sample_rate
+        self.p = p
+        self.min_order = min_rolloff // 6
+        self.max_order = max_rolloff // 6
+        self.min_cutoff_freq = min_cutoff_freq
+        self.max_cutoff_freq = max_cutoff_freq
+        self.min_center_freq = min_center_freq
+        self.max_center_freq = max_center_freq
+        self.min_bandwidth_fraction = min_bandwidth_fraction
+        self.max_bandwidth_fraction = max_bandwidth_fraction
+
+    def _uniform_mel(self, low, high, n, device):
+        low = frequency_to_mel(torch.tensor(low, dtype=torch.float64, device=device))
+        high = frequency_to_mel(torch.tensor(high, dtype=torch.float64, device=device))
+        return mel_to_frequency(low + (high - low) * torch.rand(n, dtype=torch.float64, device=device))
+
+    def randomize_parameters(self, n, device):
+        params = {'order': torch.randint(self.min_order, self.max_order + 1, (n,), device=device)}
+        nyquist = self.sample_rate // 2
+        if self.filter_type == 'bandpass':
+            center = self._uniform_mel(self.min_center_freq, self.max_center_freq, n, device)
+            fraction = self.min_bandwidth_fraction + (self.max_bandwidth_fraction - self.min_bandwidth_fraction) * \
+                torch.rand(n, dtype=torch.float64, device=device)
+            bandwidth = center * fraction
+            params['low_freq'] = center - bandwidth / 2
+            params['high_freq'] = torch.clamp(center + bandwidth / 2, max=nyquist * 0.9999)
+        else:
+            cutoff = self._uniform_mel(self.min_cutoff_freq, self.max_cutoff_freq, n, device)
+            params['cutoff_freq'] = torch.clamp(cutoff, max=nyquist * 0.9999)
+        return params
+
+    def zpk(self, params):
+        """
+        Digital zeros, poles and gain of every example's filter.
+
+        Unused slots (examples with a lower order) hold equal zeros and poles,
+        so they cancel in the response.
+        """
+        order = params['order']
+        proto = butterworth_prototype_poles(order, self.max_order)
+        unused = torch.isnan(proto.real)
+        proto = torch.where(unused, torch.zeros_like(proto), proto)
+        sr = self.sample_rate
+
+        if self.filter_type == 'lowpass':
+            wc = prewarp(params['cutoff_freq'], sr).unsqueeze(-1)
+            poles = bilinear(wc * proto, sr)
+            zeros = torch.full_like(poles, -1.0)
+            ref = torch.ones_like(wc, dtype=poles.dtype)
+        elif self.filter_type == 'highpass':
+            wc = prewarp(params['cutoff_freq'], sr).unsqueeze(-1)
+            poles = bilinear(wc / torch.where(unused, torch.ones_like(proto), proto), sr)
+            zeros = torch.full_like(poles, 1.0)
+            ref = -torch.ones_like(wc, dtype=poles.dtype)
+        else:
+            w1 = prewarp(params['low_freq'], sr).unsqueeze(-1)
+            w2 = prewarp(params['high_freq'], sr).unsqueeze(-1)
+            w0 = torch.sqrt(w1 * w2)
+            half = proto * (w2 - w1) / 2
+            root = torch.sqrt(half ** 2 - w0 ** 2)
+            poles = bilinear(torch.cat([half + root, half - root], dim=-1), sr)
+            zeros = torch.cat([torch.full_like(proto, 1.0), torch.full_like(proto, -1.0)], dim=-1)
+            unused = torch.cat([unused, unused], dim=-1)
+            ref = torch.exp(1j * 2 * torch.atan(w0 / (2 * sr)))
+
+        zeros = torch.where(unused, torch.zeros_like(zeros), zeros)
+        poles = torch.where(unused, torch.zeros_like(poles), poles)
+        gain = 1.0 / torch.abs(self._response(zeros, poles, torch.ones_like(ref.real), ref))
+        return zeros, poles, gain
+
+    @staticmethod
+    def _response(zeros, poles, gain, z):
+        h = gain.to(z.dtype)
+        for i in range(zeros.shape[-1]):
+            h = h * (z - zeros[:, i:i + 1]) / (z - poles[:, i:i + 1])
+        return h
+
+    def filter(self, x, params):
+        """Filter a (batch_size, data_length) batch with the given parameters."""
+        length = x.shape[-1]
+        n_fft = 2 ** math.ceil(math.log2(2 * length))
+        zeros, poles, gain = self.zpk(params)
+
+        # Unit-circle grid in complex64: the response is only needed at signal precision
+        w = torch.arange(n_fft // 2 + 1, device=x.device, dtype=torch.float32) * (2 * math.pi / n_fft)
+        z = torch.exp(1j * w).unsqueeze(0)
+        zeros, poles = zeros.to(torch.complex64), poles.to(torch.complex64)
+        response = self._response(zeros, poles, gain.to(torch.float32), z)
+        dc_gain = self._response(zeros, poles, gain.to(torch.float32), torch.ones_like(z[:, :1])).real
+
+        # Steady-state initial conditions for a step of height x[0], as in audiomentations
+        x0 = x[:, :1]
+        y = torch.fft.irfft(torch.fft.rfft(x - x0, n=n_fft) * response, n=n_fft)[:, :length]
+        return y + x0 * dc_gain
+
+    def forward(self, x):
+        """x: (batch_size, data_length)"""
+        apply = torch.rand(x.shape[0], device=x.device) < self.p
+        idx = torch.nonzero(apply).squeeze(-1)
+        if idx.numel() == 0:
+            return x
+        params = self.randomize_parameters(idx.numel(), x.device)
+        out = x.clone()
+        out[idx] = self.filter(x[idx].float(), params).to(x.dtype)
+        return out